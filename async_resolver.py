@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Asyncio based DNS resolution engine used by sublert.py when running on Python 3 with dnspython >= 2.0.
+
+import asyncio
+import itertools
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+def build_resolvers(nameservers, timeout): #one asyncio resolver per nameserver so that queries can be spread across them
+    resolvers = []
+    for host, port in nameservers or []:
+        resolver = dns.asyncresolver.Resolver(configure = False)
+        resolver.nameservers = [host]
+        resolver.port = port
+        resolvers.append(resolver)
+    if not resolvers: #fall back to the system configuration (/etc/resolv.conf)
+        resolvers.append(dns.asyncresolver.Resolver())
+    for resolver in resolvers:
+        resolver.timeout = timeout
+        resolver.lifetime = timeout
+    return resolvers
+
+async def query(resolver, semaphore, domain, qtype): #a single bounded lookup, exceptions are returned rather than raised
+    async with semaphore:
+        try:
+            return await resolver.resolve(domain, qtype, raise_on_no_answer = False)
+        except dns.exception.DNSException as e:
+            return e
+
+async def resolve_domain(resolver, semaphore, domain): #A and CNAME lookups of a single name run in parallel
+    answers = await asyncio.gather(query(resolver, semaphore, domain, 'A'),
+                                   query(resolver, semaphore, domain, 'CNAME'))
+    return dict(zip(['A', 'CNAME'], answers))
+
+async def resolve_all(domains, nameservers, concurrency, timeout):
+    results = {}
+    resolvers = build_resolvers(nameservers, timeout)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    pending = iter(enumerate(domains))
+
+    async def worker():
+        for index, domain in pending: #workers share the iterator so only a bounded number of names are in flight
+            resolver = resolvers[index % len(resolvers)]
+            results[domain] = await resolve_domain(resolver, semaphore, domain)
+
+    workers = max(1, concurrency // 2) #each worker can have two queries (A + CNAME) in flight
+    await asyncio.gather(*[worker() for _ in itertools.repeat(None, workers)])
+    return results
+
+def resolve(domains, nameservers = None, concurrency = 100, timeout = 5.0): #domain -> {'A': answer, 'CNAME': answer}, an answer is a dns.resolver.Answer or the exception raised by the query
+    return asyncio.run(resolve_all(list(domains), nameservers, concurrency, timeout))
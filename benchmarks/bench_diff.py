@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compares the difflib.ndiff based diff used up to 1.4.7 with the indexed SQLite diff of state_store.
+# The last columns compare the time and memory lookup() spends on holding a crt.sh answer as a set and as an index.
+# Usage: python benchmarks/bench_diff.py [--sizes 10000,100000,1000000] [--churn 0.01] [--legacy-limit 100000]
+
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import state_store
+from subdomain_index import index_builder
+
+def legacy_diff(old, new): #compare_files_diff() from sublert 1.4.7, minus the file handling
+    result = []
+    diff = difflib.ndiff([name + "\n" for name in old], [name + "\n" for name in new])
+    changes = [l for l in diff if l.startswith('+ ')]
+    for c in changes:
+        c = c.replace('+ ', '')
+        c = c.replace('*.', '')
+        c = c.replace('\n', '')
+        result.append(c)
+        result = list(set(result))
+    return sorted(result)
+
+def store_diff(store, new): #stages the new lookup and queries the added names, the baseline is stored beforehand
+    store.stage("example.com", new, None, complete = True)
+    added, removed = store.changes("example.com")
+    return sorted(set(name.replace('*.', '') for name in added))
+
+def dataset(size, churn, seed = 1):
+    rng = random.Random(seed)
+    names = sorted(set("{}-{}.{}.example.com".format(rng.choice(["api", "dev", "mail", "vpn", "www"]), i, rng.choice(["eu", "us", "ap"])) for i in range(size)))
+    changed = int(size * churn)
+    old = [name for i, name in enumerate(names) if i % max(1, size // max(1, changed)) != 0 or i >= size - changed]
+    new = [name for i, name in enumerate(names) if i < size - changed]
+    return old, new
+
+def measure(function, *args): #timed on its own, tracing the allocations slows down code that makes many small ones
+    start = time.time()
+    result = function(*args)
+    elapsed = time.time() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1] #Python allocations only, SQLite's page cache isn't counted
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def lookup_set(names): #how lookup() held the names of a crt.sh answer before the index: a set of fresh str, then a sorted list
+    return sorted(set(name.lower() for name in names))
+
+def lookup_index(names):
+    builder = index_builder()
+    for name in names:
+        builder.add(name.lower())
+    return builder.finish()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default = "10000,100000,1000000")
+    parser.add_argument("--churn", type = float, default = 0.01, help = "Fraction of names added and removed between runs.")
+    parser.add_argument("--legacy-limit", type = int, default = 100000, help = "Skip the ndiff implementation above this size.")
+    args = parser.parse_args()
+
+    print("{:>9} {:>8} {:>10} {:>10} {:>10} {:>11} {:>14} {:>15} {:>16} {:>17} {:>12}".format("names", "added", "ndiff (s)", "ndiff (MB)",
+        "sqlite (s)", "sqlite (MB)", "lookup set (s)", "lookup set (MB)", "lookup index (s)", "lookup index (MB)", "bytes/name"))
+    for size in [int(size) for size in args.sizes.split(",")]:
+        old, new = dataset(size, args.churn)
+        store = state_store(":memory:")
+        store.add_domain("example.com", old)
+        added, store_time, store_peak = measure(store_diff, store, new)
+        store.close()
+        legacy_time = legacy_peak = float("nan")
+        if size <= args.legacy_limit:
+            expected, legacy_time, legacy_peak = measure(legacy_diff, old, new)
+            assert expected == added, "ndiff and sqlite results differ"
+        names, set_time, set_peak = measure(lookup_set, new)
+        index, index_time, index_peak = measure(lookup_index, new)
+        assert list(sorted(index)) == names, "the index doesn't hold the names of the lookup"
+        print("{:>9} {:>8} {:>10.2f} {:>10.1f} {:>10.2f} {:>11.1f} {:>14.2f} {:>15.1f} {:>16.2f} {:>17.1f} {:>12.1f}".format(size, len(added),
+            legacy_time, legacy_peak / 1e6, store_time, store_peak / 1e6, set_time, set_peak / 1e6, index_time, index_peak / 1e6,
+            len(index.data) / float(len(index))))
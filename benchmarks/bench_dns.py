@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compares the sequential resolver with the asyncio engine against a local stub DNS server, then measures a
+# rerun served from the DNS cache and a zone with a wildcard record.
+# Usage: python benchmarks/bench_dns.py [-n 2000] [--delay 0.02] [--concurrency 100]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sublert
+from state_store import state_store
+from stub_dns import stub_dns_server
+
+def run(label, subdomains, nameservers, cached = False): #every run starts with an empty DNS cache unless cached is set
+    if not cached:
+        sublert.store = state_store(os.path.join(directory, "{}.db".format(label)))
+    queries = server.queries
+    start = time.time()
+    results, suppressed = sublert.resolve_subdomains(subdomains, nameservers)
+    elapsed = time.time() - start
+    resolved = sum(1 for records in results.values() if records)
+    print("{:<12} {:>8} names {:>8} resolved {:>10.2f}s {:>10.0f} names/s {:>8} queries".format(
+        label, len(subdomains), resolved, elapsed, len(subdomains) / elapsed, server.queries - queries))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest = "count", type = int, default = 2000)
+    parser.add_argument("--delay", type = float, default = 0.02, help = "Simulated latency per answer in seconds.")
+    parser.add_argument("--concurrency", type = int, default = 100)
+    parser.add_argument("--skip-sequential", action = "store_true")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    server = stub_dns_server(delay = args.delay, wildcards = ["dev.example.com"]).start()
+    nameservers = [(server.host, server.port)]
+    subdomains = ["{}host{}.example.com".format("nx" if i % 10 == 0 else "", i) for i in range(args.count)]
+    sublert.dns_concurrency = args.concurrency
+    try:
+        if sublert.async_resolver:
+            expected = run("asyncio", subdomains, nameservers)
+            assert run("cached", subdomains, nameservers, cached = True) == expected, "cached results differ"
+            queries = server.queries
+            run("cached", subdomains, nameservers, cached = True)
+            assert server.queries == queries, "the rerun wasn't served from the cache"
+            wildcard = run("wildcard", ["host{}.dev.example.com".format(i) for i in range(args.count)], nameservers)
+            assert not any(wildcard.values()), "names under the wildcard zone were not ignored"
+        if not args.skip_sequential:
+            engine, sublert.async_resolver = sublert.async_resolver, None
+            try:
+                sequential = run("sequential", subdomains, nameservers)
+            finally:
+                sublert.async_resolver = engine
+            if engine:
+                assert sequential == expected, "asyncio and sequential results differ"
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
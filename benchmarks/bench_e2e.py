@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding: utf-8
+# End-to-end benchmark of `python sublert.py` against local stand-ins for every external service: the fake
+# crt.sh JSON API (or a local Postgres seeded with the same certificate_identity fixture), the stub DNS server
+# and the stub Slack webhook. A scratch copy of the tree is pointed at them, a baseline run is followed by
+# rounds of certificate churn, and every run's wall time, throughput, per-domain latency percentiles, time to
+# the first Slack alert and peak RSS are recorded. The notified subdomains are checked against the names the churn issued.
+# Usage: python benchmarks/bench_e2e.py [--scale small|medium|large] [--domains N] [--subdomains N] [--churn 0.05]
+#        [--rounds 3] [--threads 20] [--slow-domain SECONDS] [--postgres host:port:dbname:user] [--output results.json] [--compare old.json] [--profile] [--keep]
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from crtsh_fixture import crtsh_fixture
+from fake_crtsh import fake_crtsh_server
+from stub_dns import stub_dns_server
+from stub_slack import stub_slack_server
+
+SCALES = {"small": (20, 100), "medium": (200, 500), "large": (1000, 2000)} #domains, subdomains per domain
+
+def scratch_tree(directory, settings): #copy of the sublert sources with config.py pointed at the stand-ins
+    work = os.path.join(directory, "work")
+    os.makedirs(os.path.join(work, "output"))
+    for path in glob.glob(os.path.join(ROOT, "*.py")):
+        shutil.copy(path, work)
+    config = os.path.join(work, "config.py")
+    with open(config) as source:
+        text = source.read()
+    for name, value in settings.items():
+        text, count = re.subn(r"(?m)^{} = .*$".format(name), "{} = {!r}".format(name, value), text)
+        assert count == 1, "{} not found in config.py".format(name)
+    with open(config, "w") as target:
+        target.write(text)
+    return work
+
+def run(work, arguments): #runs sublert.py to completion, returns its wall time, exit status and peak RSS in MB
+    with open(os.path.join(work, "output", "sublert.log"), "a") as log:
+        start = time.time()
+        process = subprocess.Popen([sys.executable, "sublert.py"] + arguments, cwd = work, stdout = log, stderr = subprocess.STDOUT)
+        pid, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+    return elapsed, os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1, usage.ru_maxrss / 1024.0
+
+def notified(messages): #subdomains listed in the ":new:" Slack messages
+    names = set()
+    for message in messages:
+        text = message["text"]
+        if ":new:" in text and "```" in text:
+            names.update(line for line in text.split("```")[1].split("\n") if line and not line.startswith(" "))
+    return names
+
+def streamed(path, change): #subdomains of the NDJSON findings sublert wrote with --sink, the file is emptied for the next round
+    names = set()
+    if os.path.exists(path):
+        with open(path) as findings:
+            names.update(event["subdomain"] for event in map(json.loads, findings) if event["change"] == change)
+        os.remove(path)
+    return names
+
+def measure(name, work, arguments, fixture, slack, crtsh, domains):
+    messages, requests = len(slack.messages), crtsh.requests
+    started = time.time()
+    elapsed, status, rss = run(work, arguments)
+    first_alert = slack.arrivals[messages] - started if len(slack.arrivals) > messages else 0
+    with open(os.path.join(work, "output", "run_summary.json")) as summary:
+        summary = json.load(summary)
+    counters, check = summary["counters"], summary["stages"].get("check", {})
+    result = {"round": name, "arguments": arguments, "status": status, "seconds": elapsed, "peak_rss_mb": rss,
+              "domains_per_second": domains / elapsed, "rows_per_second": counters.get("sublert_crtsh_rows_total", 0) / elapsed,
+              "check_p50": check.get("p50", 0), "check_p95": check.get("p95", 0), "check_p99": check.get("p99", 0),
+              "first_alert": first_alert, "crtsh_requests": crtsh.requests - requests, "slack_messages": len(slack.messages) - messages,
+              "counters": counters}
+    print("{:<10} {:>7.2f}s {:>8.1f} domains/s {:>10.0f} rows/s  check p50 {:.3f}s p95 {:.3f}s p99 {:.3f}s  first alert {:>6.2f}s  {:>7.1f} MB  {} new, {} removed".format(
+        name, elapsed, result["domains_per_second"], result["rows_per_second"], result["check_p50"], result["check_p95"],
+        result["check_p99"], first_alert, rss, counters.get("sublert_new_subdomains_total", 0), counters.get("sublert_removed_subdomains_total", 0)))
+    assert status == 0, "sublert exited with {}, see {}".format(status, os.path.join(work, "output", "sublert.log"))
+    return result, slack.messages[messages:]
+
+def compare(results, previous, tolerance): #returns the rounds that got slower or bigger than the previous results allow
+    regressions = []
+    before = dict((result["round"], result) for result in previous["rounds"])
+    for result in results["rounds"]:
+        old = before.get(result["round"])
+        if not old:
+            continue
+        for key in ("seconds", "peak_rss_mb", "check_p95"):
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append("{} {}: {:.3f} -> {:.3f}".format(result["round"], key, old[key], result[key]))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices = sorted(SCALES), default = "small")
+    parser.add_argument("--domains", type = int, help = "Number of monitored domains (Default: from --scale).")
+    parser.add_argument("--subdomains", type = int, help = "Subdomains per domain (Default: from --scale).")
+    parser.add_argument("--duplicates", type = int, default = 2, help = "Certificates logged for every name.")
+    parser.add_argument("--churn", type = float, default = 0.05, help = "Fraction of every domain's names issued and dropped per round.")
+    parser.add_argument("--rounds", type = int, default = 3)
+    parser.add_argument("--threads", type = int, default = 20)
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--crtsh-delay", type = float, default = 0.05, help = "Simulated crt.sh latency per lookup in seconds.")
+    parser.add_argument("--slow-domain", type = float, default = 0, help = "Simulated crt.sh latency of the first domain in seconds, E.g: a lookup close to its timeout.")
+    parser.add_argument("--dns-delay", type = float, default = 0.01, help = "Simulated DNS latency per query in seconds.")
+    parser.add_argument("--postgres", help = "host:port:dbname:user of a local Postgres to seed and query instead of the fake JSON API.")
+    parser.add_argument("--output", help = "Write the results as JSON, E.g: to compare a later run against.")
+    parser.add_argument("--compare", help = "Results of a previous run, exits with 1 when a round regressed by more than --tolerance.")
+    parser.add_argument("--tolerance", type = float, default = 0.2)
+    parser.add_argument("--keep", action = "store_true", help = "Keep the scratch directory.")
+    parser.add_argument("--profile", action = "store_true", help = "Run sublert with --profile, the hot paths are written to output/sublert.log.")
+    args = parser.parse_args()
+    domain_count, subdomain_count = args.domains or SCALES[args.scale][0], args.subdomains or SCALES[args.scale][1]
+
+    directory = tempfile.mkdtemp(prefix = "sublert-bench-")
+    fixture = crtsh_fixture(os.path.join(directory, "crtsh.db"), args.seed)
+    start = time.time()
+    domains = fixture.build(domain_count, subdomain_count, args.duplicates)
+    print("fixture: {} domains, {} subdomains each, {} certificate_identity rows in {:.2f}s".format(
+        domain_count, subdomain_count, fixture.count(), time.time() - start))
+
+    crtsh = fake_crtsh_server(fixture.path, delay = args.crtsh_delay, slow = {domains[0]: args.slow_domain} if args.slow_domain else None).start()
+    dns = stub_dns_server(delay = args.dns_delay).start()
+    slack = stub_slack_server(rate_limit_every = 0).start()
+    settings = {"crtsh_url": crtsh.url, "posting_webhook": slack.url, "errorlogging_webhook": slack.url,
+                "slack_sleep_enabled": False, "lookup_retries": 0, "http_cache_ttl": 0,
+                "DB_HOST": "127.0.0.1", "DB_PORT": 1} #nothing listens on port 1, lookups fall back to the JSON API right away
+    postgres = None
+    if args.postgres:
+        host, port, dbname, user = args.postgres.split(":")
+        postgres = {"host": host, "port": int(port), "dbname": dbname, "user": user}
+        settings.update({"DB_HOST": host, "DB_PORT": int(port), "DB_NAME": dbname, "DB_USER": user})
+    work = scratch_tree(directory, settings)
+    with open(os.path.join(work, "domains.txt"), "w") as targets: #imported into the state database by the first run
+        targets.write("\n".join(domains) + "\n")
+
+    findings = os.path.join(work, "output", "findings.ndjson")
+    results = {"domains": domain_count, "subdomains": subdomain_count, "duplicates": args.duplicates, "churn": args.churn,
+               "threads": args.threads, "postgres": bool(postgres), "rounds": []}
+    regressions = []
+    try:
+        if postgres:
+            fixture.seed_postgres(**postgres)
+        result, messages = measure("baseline", work, ["-q", "-t", str(args.threads)], fixture, slack, crtsh, len(domains))
+        results["rounds"].append(result)
+        dropped = set()
+        for number in range(1, args.rounds + 1):
+            fixture.churn(args.churn, args.duplicates)
+            dropped.update(fixture.removed)
+            if postgres:
+                fixture.seed_postgres(**postgres)
+            arguments = ["-q", "-t", str(args.threads), "-r", "--resolvers", "127.0.0.1:{}".format(dns.port), "--sink", findings] + (["--profile"] if args.profile else [])
+            result, messages = measure("churn{}".format(number), work, arguments, fixture, slack, crtsh, len(domains))
+            results["rounds"].append(result)
+            expected = set(name for name in fixture.added if not name.startswith("nx")) #the stub DNS server answers NXDOMAIN for nx* names
+            names = notified(messages)
+            assert names == expected, "{} issued subdomains were not notified, {} were notified wrongly".format(
+                len(expected - names), len(names - expected))
+            assert streamed(findings, "new") == expected, "the NDJSON sink didn't receive the notified subdomains"
+        result, messages = measure("resync", work, ["-q", "-t", str(args.threads), "-f"], fixture, slack, crtsh, len(domains))
+        results["rounds"].append(result)
+        assert result["counters"].get("sublert_removed_subdomains_total", 0) == len(dropped), "dropped subdomains were not all reported as removed"
+        print("ok, {} crt.sh requests ({} not modified, {:.1f} MB sent), {} DNS queries, {} Slack messages".format(
+            crtsh.requests, crtsh.not_modified, crtsh.bytes_sent / 1048576.0, dns.queries, len(slack.messages)))
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(results, output, indent = 2, sort_keys = True)
+        if args.compare:
+            with open(args.compare) as previous:
+                regressions = compare(results, json.load(previous), args.tolerance)
+            for regression in regressions:
+                print("regression: " + regression)
+    finally:
+        crtsh.stop()
+        dns.stop()
+        slack.stop()
+        fixture.close()
+        if args.keep:
+            print("scratch directory: " + directory)
+        else:
+            shutil.rmtree(directory)
+    sys.exit(1 if regressions else 0)
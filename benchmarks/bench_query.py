@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compares the crt.sh Postgres query of sublert 1.5.0 before and after the SQL-side filtering (every identity
+# row vs DISTINCT lower-cased names, unanchored vs anchored reverse pattern, known names left out) against a
+# local Postgres seeded with the crtsh_fixture dataset. Reports the query time, the bytes of the query sent to
+# the server, the rows and the bytes of the DataRow messages sent back, and checks that both queries find the same subdomains.
+# Usage: python benchmarks/bench_query.py --postgres host:port:dbname:user [--domains 50] [--subdomains 1000] [--duplicates 4]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import psycopg2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sublert
+from crtsh_fixture import crtsh_fixture
+
+def legacy_query(domain, since = None): #cert_database.lookup() before the change, names were lower-cased and deduplicated in Python
+    query = "SELECT ci.NAME_VALUE NAME_VALUE, ci.CERTIFICATE_ID CERTIFICATE_ID FROM certificate_identity ci WHERE ci.NAME_TYPE = 'dNSName' AND reverse(lower(ci.NAME_VALUE)) LIKE reverse(lower('%{}'))".format(domain)
+    if since:
+        query += " AND ci.CERTIFICATE_ID > {}".format(int(since))
+    return query, None
+
+def is_subdomain(name, domain): #the Python-side check of the legacy lookup, the anchored pattern does it in SQL
+    return name == domain or name.endswith("." + domain)
+
+def wire_size(row): #size of the DataRow message: type, length and column count, then a length and the text of each value
+    return 7 + sum(4 + (len(str(value)) if value is not None else 0) for value in row)
+
+def run(conn, query, parameters, domain):
+    query_size = len(conn.cursor().mogrify(query, parameters)) #the known names travel to the server inside the query
+    cursor = conn.cursor(name = "bench_lookup")
+    start = time.time()
+    cursor.execute(query, parameters)
+    rows = size = 0
+    names = set()
+    while True:
+        batch = cursor.fetchmany(10000)
+        if not batch:
+            break
+        rows += len(batch)
+        size += sum(wire_size(row) for row in batch)
+        names.update(name.lower() for name, certificate_id in batch if name is not None and is_subdomain(name.lower(), domain))
+    cursor.close()
+    conn.rollback()
+    return time.time() - start, query_size, rows, size, names
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--postgres", required = True, help = "host:port:dbname:user of a local Postgres, its certificate_identity table is replaced.")
+    parser.add_argument("--domains", type = int, default = 50)
+    parser.add_argument("--subdomains", type = int, default = 1000)
+    parser.add_argument("--duplicates", type = int, default = 4, help = "Certificates logged for every name.")
+    parser.add_argument("--churn", type = float, default = 0.02)
+    args = parser.parse_args()
+    host, port, dbname, user = args.postgres.split(":")
+    connection = {"host": host, "port": int(port), "dbname": dbname, "user": user}
+
+    directory = tempfile.mkdtemp()
+    fixture = crtsh_fixture(os.path.join(directory, "crtsh.db"))
+    try:
+        domains = fixture.build(args.domains, args.subdomains, args.duplicates)
+        known = dict((domain, fixture.names(domain)) for domain in domains)
+        since = fixture.next_id() - 1
+        fixture.churn(args.churn, args.duplicates)
+        fixture.seed_postgres(**connection)
+        print("{} certificate_identity rows, {} domains".format(fixture.count(), len(domains)))
+
+        conn = psycopg2.connect(**connection)
+        variants = [("full, legacy", lambda domain: legacy_query(domain)),
+                    ("full, distinct", lambda domain: sublert.identities_query(domain)),
+                    ("incremental, legacy", lambda domain: legacy_query(domain, since)),
+                    ("incremental, distinct", lambda domain: sublert.identities_query(domain, since)),
+                    ("incremental, known excluded", lambda domain: sublert.identities_query(domain, since, sorted(known[domain])))]
+        results = {}
+        for name, query in variants:
+            elapsed = uploaded = rows = size = 0
+            found = {}
+            for domain in domains:
+                seconds, query_size, count, sent, names = run(conn, *query(domain), domain = domain)
+                elapsed, uploaded, rows, size = elapsed + seconds, uploaded + query_size, rows + count, size + sent
+                found[domain] = names
+            results[name] = found
+            print("{:<28} {:>8.2f}s {:>8.2f} MB up {:>10} rows {:>8.2f} MB down".format(name, elapsed, uploaded / 1048576.0, rows, size / 1048576.0))
+        conn.close()
+        for domain in domains:
+            assert results["full, legacy"][domain] == results["full, distinct"][domain], "full lookups of {} differ".format(domain)
+            assert results["incremental, legacy"][domain] == results["incremental, distinct"][domain], "incremental lookups of {} differ".format(domain)
+            assert results["incremental, known excluded"][domain] == results["incremental, distinct"][domain] - known[domain], \
+                "known names of {} were not excluded".format(domain)
+        print("ok")
+    finally:
+        fixture.close()
+        shutil.rmtree(directory)
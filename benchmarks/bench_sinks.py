@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Measures how long new subdomains take to reach a consumer through each output sink (an NDJSON file tailed by
+# a reader, a local NDJSON webhook and a Unix socket listener) compared with the Slack notifier posting to the
+# stub webhook one message per second, and checks that every sink delivered every finding exactly once.
+# Usage: python benchmarks/bench_sinks.py [-n 2000] [--domains 20] [--batch-size 100] [--flush-interval 1] [--slack-interval 1]
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sinks import opening_sink, encode_events
+from slack_notifier import slack_notifier
+from stub_slack import stub_slack_server
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: #python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+class receiver(object): #arrival time of every subdomain seen by a consumer
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrivals = {}
+        self.duplicates = 0
+        self.connections = 0
+
+    def received(self, line):
+        event = json.loads(line)
+        with self.lock:
+            if event["subdomain"] in self.arrivals:
+                self.duplicates += 1
+            self.arrivals[event["subdomain"]] = time.time()
+
+class webhook_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.receiver.lock:
+            self.server.receiver.connections += 1 #one per keep-alive connection
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        for line in body.splitlines():
+            self.server.receiver.received(line)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class threading_server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def listening(path, consumer): #accepts sublert's connections on a Unix socket and reads NDJSON lines from them
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(5)
+    def serve():
+        while True:
+            try:
+                connection, address = listener.accept()
+            except (socket.error, OSError):
+                break
+            for line in connection.makefile("r"):
+                consumer.received(line)
+    thread = threading.Thread(target = serve)
+    thread.daemon = True
+    thread.start()
+    return listener
+
+def tailing(path, consumer, stopping): #reads the lines appended to an NDJSON file the way `tail -f` does
+    while not os.path.exists(path):
+        time.sleep(0.01)
+    with open(path) as source:
+        pending = ""
+        while True:
+            chunk = source.readline()
+            if not chunk:
+                if stopping.is_set():
+                    break
+                time.sleep(0.01)
+                continue
+            pending += chunk
+            if pending.endswith("\n"):
+                consumer.received(pending)
+                pending = ""
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0
+
+def report(name, emitted, arrivals, expected, extra = ""):
+    delays = [arrivals[subdomain] - emitted[subdomain] for subdomain in arrivals if subdomain in emitted]
+    last = max(arrivals.values()) - min(emitted.values()) if arrivals else 0
+    print("{:<10} {:>6} findings  p50 {:>7.3f}s  p99 {:>7.3f}s  all delivered after {:>7.2f}s {}".format(
+        name, len(arrivals), percentile(delays, 0.5), percentile(delays, 0.99), last, extra))
+    assert set(arrivals) == expected, "{}: {} findings missing".format(name, len(expected - set(arrivals)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest = "count", type = int, default = 2000)
+    parser.add_argument("--domains", type = int, default = 20)
+    parser.add_argument("--batch-size", type = int, default = 100)
+    parser.add_argument("--flush-interval", type = float, default = 1.0)
+    parser.add_argument("--slack-interval", type = float, default = 1.0, help = "Seconds between two Slack posts, like slack_sleep_enabled.")
+    parser.add_argument("--slack-batch-size", type = int, default = 50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix = "sublert-sinks-")
+    stopping = threading.Event()
+    consumers = {"file": receiver(), "webhook": receiver(), "unix": receiver()}
+    server = threading_server(("127.0.0.1", 0), webhook_handler)
+    server.receiver = consumers["webhook"]
+    threading.Thread(target = server.serve_forever).start()
+    listener = listening(os.path.join(directory, "sublert.sock"), consumers["unix"])
+    tail = threading.Thread(target = tailing, args = (os.path.join(directory, "findings.ndjson"), consumers["file"], stopping))
+    tail.start()
+    slack = stub_slack_server(rate_limit_every = 0).start()
+    notifier = slack_notifier(slack.url, min_interval = args.slack_interval)
+    options = {"batch_size": args.batch_size, "flush_interval": args.flush_interval}
+    sinks = {"file": opening_sink(os.path.join(directory, "findings.ndjson"), **options),
+             "webhook": opening_sink("http://127.0.0.1:{}/hook".format(server.server_address[1]), **options),
+             "unix": opening_sink("unix:" + os.path.join(directory, "sublert.sock"), **options)}
+
+    emitted = {}
+    try:
+        per_domain = args.count // args.domains
+        for number in range(args.domains): #one domain's diff completes every 10 ms, like the per-domain daemon checks
+            domain = "target{}.com".format(number)
+            subdomains = ["host{}.{}".format(i, domain) for i in range(per_domain)]
+            now = time.time()
+            emitted.update((subdomain, now) for subdomain in subdomains)
+            lines = encode_events("new", domain, subdomains, dict((subdomain, {"A": ["127.0.0.1"]}) for subdomain in subdomains))
+            for sink in sinks.values():
+                sink.emit(lines)
+            for i in range(0, len(subdomains), args.slack_batch_size): #slack_findings() sends slack_batch_size names per message
+                notifier.post("{} new subdomains of {}\n```{}```".format(len(subdomains), domain, "\n".join(subdomains[i:i + args.slack_batch_size])))
+            time.sleep(0.01)
+        for sink in sinks.values():
+            sink.close()
+        notifier.close()
+        slack_done = time.time() #the stub only records when a whole message arrived
+        stopping.set()
+        tail.join()
+        time.sleep(0.2) #lets the socket reader drain
+        expected = set(emitted)
+        report("file", emitted, consumers["file"].arrivals, expected)
+        report("webhook", emitted, consumers["webhook"].arrivals, expected, "({} connections)".format(consumers["webhook"].connections))
+        report("unix", emitted, consumers["unix"].arrivals, expected)
+        print("{:<10} {:>6} findings  in {} messages, all delivered after {:>7.2f}s".format("slack", len(expected), len(slack.messages),
+                                                                                          slack_done - min(emitted.values())))
+        for name in ("file", "webhook", "unix"):
+            assert not consumers[name].duplicates, "{} delivered {} findings twice".format(name, consumers[name].duplicates)
+        print("ok")
+    finally:
+        server.shutdown()
+        server.server_close()
+        listener.close()
+        slack.stop()
+        shutil.rmtree(directory)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compares one blocking post per line (sublert 1.4.7) with the batched background notifier against a local
+# stub webhook that rate limits every Nth request, and checks that every new subdomain was delivered.
+# Usage: python benchmarks/bench_slack.py [-n 500] [--domains 5] [--rate-limit-every 5] [--retry-after 1]
+
+import argparse
+import json
+import os
+import sys
+import time
+import requests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sublert
+from slack_notifier import slack_notifier
+from stub_slack import stub_slack_server
+
+def legacy_posting(url, subdomains, dns_result): #posting_to_slack() from sublert 1.4.7 without its 1 second sleep, returns the number of posts
+    posts = 0
+    for subdomain in subdomains:
+        lines = ["{}:new: {}".format(sublert.at_channel(), subdomain)]
+        lines += ["```A : {}```".format(i) for i in dns_result[subdomain].get("A", [])]
+        lines += ["```CNAME : {}```".format(i) for i in dns_result[subdomain].get("CNAME", [])]
+        for line in lines:
+            requests.post(url, data = json.dumps({'text': line}), headers = {'Content-Type': 'application/json'})
+            posts += 1
+    return posts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest = "count", type = int, default = 500)
+    parser.add_argument("--domains", type = int, default = 5)
+    parser.add_argument("--rate-limit-every", type = int, default = 5, help = "Answer every Nth request with a 429.")
+    parser.add_argument("--retry-after", type = int, default = 1)
+    args = parser.parse_args()
+
+    subdomains = ["host{}.example{}.com".format(i, i % args.domains) for i in range(args.count)]
+    dns_result = dict((name, {"A": ["127.0.0.{}".format(i % 250 + 1)], "CNAME": ["edge{}.cdn.net".format(i)] if i % 3 == 0 else []}) for i, name in enumerate(subdomains))
+
+    server = stub_slack_server(rate_limit_every = 0).start()
+    try:
+        start = time.time()
+        posts = legacy_posting(server.url, subdomains, dns_result)
+        elapsed = time.time() - start
+        print("{:<10} {:>6} posts {:>8.2f}s, plus {}s of fixed sleeps when slack_sleep_enabled".format("legacy", posts, elapsed, posts))
+    finally:
+        server.stop()
+
+    server = stub_slack_server(rate_limit_every = args.rate_limit_every, retry_after = args.retry_after).start()
+    try:
+        sublert.notifier = slack_notifier(server.url, retries = 5)
+        start = time.time()
+        groups = {}
+        for subdomain in subdomains: #the monitored domain of each name, the way the pipeline hands them to exporting()
+            groups.setdefault(subdomain.split(".", 1)[1], []).append(subdomain)
+        for domain in sorted(groups):
+            sublert.slack_findings(domain, groups[domain], dns_result)
+        queued = time.time() - start
+        sublert.notifier.close()
+        elapsed = time.time() - start
+        print("{:<10} {:>6} posts {:>8.2f}s ({:.3f}s blocking discovery), {} rate limited, {} failed".format(
+            "notifier", server.requests, elapsed, queued, server.rate_limited, sublert.notifier.failed))
+        delivered = "\n".join(message["text"] for message in server.messages)
+        missing = [name for name in subdomains if name + "\n" not in delivered and name + "```" not in delivered]
+        assert not missing, "{} subdomains were not delivered".format(len(missing))
+    finally:
+        server.stop()
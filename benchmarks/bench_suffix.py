@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compares tld.get_fld() with the compiled suffix_matcher and a plain suffix check on a realistic list of names.
+# Usage: python benchmarks/bench_suffix.py [-n 1000000]
+
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tld import get_fld
+from suffix_matcher import suffix_matcher
+
+APEXES = ["example.com", "example.co.uk", "example.com.au", "example.org", "example.de", "example.co.jp",
+          "example.github.io", "example.s3.amazonaws.com", "example.city.kawasaki.jp", "example.xn--p1ai"]
+LABELS = ["www", "api", "dev", "staging", "mail", "vpn", "cdn", "static", "internal", "eu-west-1", "*", "admin"]
+
+def dataset(count, seed = 1):
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        labels = [rng.choice(LABELS) for _ in range(rng.randint(0, 3))]
+        labels.append("host{}".format(i))
+        names.append(".".join(labels + [rng.choice(APEXES)]))
+    return names
+
+def measure(label, function, names):
+    start = time.time()
+    result = [function(name) for name in names]
+    elapsed = time.time() - start
+    print("{:<28} {:>8.2f}s {:>12.0f} names/s".format(label, elapsed, len(names) / elapsed))
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest = "count", type = int, default = 1000000)
+    args = parser.parse_args()
+
+    names = dataset(args.count)
+    get_fld("https://example.com") #loads the tld data before timing
+    start = time.time()
+    matcher = suffix_matcher()
+    print("{:<28} {:>8.2f}s".format("suffix_matcher compile", time.time() - start))
+    expected = measure("tld.get_fld", lambda name: get_fld("https://" + name), names)
+    result = measure("registrable_domain", matcher.registrable_domain, names)
+    measure("registrable_domain (warm)", matcher.registrable_domain, names)
+    measure("plain suffix check", lambda name: name == "example.com" or name.endswith(".example.com"), names)
+    assert result == expected, "suffix_matcher and tld.get_fld results differ"
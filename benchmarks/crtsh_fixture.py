@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Seeded synthetic crt.sh dataset used by the benchmarks. The certificates live in a sqlite copy of crt.sh's
+# certificate_identity table, which the fake JSON API serves and which can be loaded into a local Postgres.
+# Every name is logged in several certificates like renewals do, and churn() issues and drops names between rounds.
+
+import random
+import sqlite3
+
+WORDS = ("api", "dev", "staging", "mail", "vpn", "cdn", "admin", "portal", "auth", "git", "jenkins", "shop",
+         "beta", "internal", "static", "m", "grafana", "status", "docs", "test")
+
+class crtsh_fixture(object):
+    def __init__(self, path, seed = 1):
+        self.path = path
+        self.random = random.Random(seed)
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS certificate_identity (certificate_id INTEGER, name_type TEXT, name_value TEXT, apex TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS certificate_identity_apex ON certificate_identity (apex, certificate_id)")
+        self.labels = self.next_id() #keeps generated labels unique when an existing fixture is reopened
+        self.added = set() #names issued by the last churn(), E.g: to check what was notified
+        self.removed = set()
+
+    def next_id(self):
+        return (self.conn.execute("SELECT max(certificate_id) FROM certificate_identity").fetchone()[0] or 0) + 1
+
+    def label(self, nxdomain_rate):
+        self.labels += 1
+        label = "{}{}".format(self.random.choice(WORDS), self.labels)
+        if self.random.random() < nxdomain_rate: #the stub DNS server answers NXDOMAIN for these
+            label = "nx" + label
+        return label
+
+    def issue(self, apex, names, duplicates, certificate_id): #one certificate per name and per renewal, each also covering the apex
+        rows = []
+        for name in names:
+            for renewal in range(duplicates):
+                rows.append((certificate_id, "dNSName", name, apex))
+                rows.append((certificate_id, "dNSName", apex, apex))
+                certificate_id += 1
+        self.conn.executemany("INSERT INTO certificate_identity VALUES (?, ?, ?, ?)", rows)
+        return certificate_id
+
+    def build(self, domains, subdomains, duplicates = 2, nxdomain_rate = 0.05): #returns the monitored domains
+        apexes = ["target{}.com".format(i) for i in range(domains)]
+        certificate_id = self.next_id()
+        with self.conn:
+            for apex in apexes:
+                names = ["{}.{}".format(self.label(nxdomain_rate), apex) for i in range(subdomains - 2)] + ["*." + apex, "www." + apex]
+                certificate_id = self.issue(apex, names, duplicates, certificate_id)
+        return apexes
+
+    def churn(self, rate, duplicates = 2, nxdomain_rate = 0.05, renewal_rate = 0.1): #issues and drops about rate * subdomains names per domain, and renews renewal_rate of the others
+        self.added, self.removed = set(), set()
+        certificate_id = self.next_id()
+        with self.conn:
+            for apex in self.domains():
+                names = self.names(apex) - set([apex, "*." + apex, "www." + apex])
+                count = int(round(rate * len(names))) or 1
+                dropped = self.random.sample(sorted(names), min(count, len(names)))
+                self.conn.executemany("DELETE FROM certificate_identity WHERE apex = ? AND name_value = ?", [(apex, name) for name in dropped])
+                issued = ["{}.{}".format(self.label(nxdomain_rate), apex) for i in range(count)]
+                renewed = self.random.sample(sorted(names - set(dropped)), int(renewal_rate * len(names))) #already known, must not be notified again
+                certificate_id = self.issue(apex, issued, duplicates, certificate_id)
+                certificate_id = self.issue(apex, renewed, 1, certificate_id)
+                self.added.update(issued)
+                self.removed.update(dropped)
+
+    def domains(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT apex FROM certificate_identity ORDER BY apex")]
+
+    def names(self, apex):
+        return set(row[0] for row in self.conn.execute("SELECT DISTINCT name_value FROM certificate_identity WHERE apex = ?", (apex,)))
+
+    def rows(self, apex): #(certificate_id, name_value) the way crt.sh lists them, newest first
+        return self.conn.execute("SELECT certificate_id, name_value FROM certificate_identity WHERE apex = ? ORDER BY certificate_id DESC", (apex,)).fetchall()
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM certificate_identity").fetchone()[0]
+
+    def seed_postgres(self, **connection): #replaces certificate_identity in a local Postgres, E.g: host = "127.0.0.1", dbname = "certwatch", user = "guest"
+        import psycopg2
+        from psycopg2.extras import execute_values
+        conn = psycopg2.connect(**connection)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS certificate_identity")
+                cursor.execute("CREATE TABLE certificate_identity (certificate_id bigint, name_type text, name_value text)")
+                rows = self.conn.execute("SELECT certificate_id, name_type, name_value FROM certificate_identity")
+                while True:
+                    batch = rows.fetchmany(10000)
+                    if not batch:
+                        break
+                    execute_values(cursor, "INSERT INTO certificate_identity VALUES %s", batch)
+                cursor.execute("CREATE INDEX certificate_identity_reverse ON certificate_identity (reverse(lower(name_value)) text_pattern_ops)")
+                cursor.execute("ANALYZE certificate_identity")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Local fake of the crt.sh JSON API used by the benchmarks. Serves ?q=%.<domain>&output=json from a
+# crtsh_fixture database with an ETag per answer, and delays each answer to simulate crt.sh latency.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError: #python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+class fake_crtsh_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server.fake
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        apex = query[2:] if query.startswith("%.") else query
+        time.sleep(server.slow.get(apex, server.delay))
+        conn = sqlite3.connect(server.path)
+        try:
+            rows = conn.execute("SELECT certificate_id, name_value FROM certificate_identity WHERE apex = ? ORDER BY certificate_id DESC", (apex,)).fetchall()
+        finally:
+            conn.close()
+        body = json.dumps([{"issuer_ca_id": 16418, "issuer_name": "C=US, O=Let's Encrypt, CN=R3", "common_name": apex,
+                            "name_value": name, "id": certificate_id, "entry_timestamp": "2020-01-01T00:00:00.000",
+                            "not_before": "2020-01-01T00:00:00", "not_after": "2020-04-01T00:00:00"}
+                           for certificate_id, name in rows]).encode("utf-8")
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        with server.lock:
+            server.requests += 1
+        if self.headers.get("If-None-Match") == etag:
+            with server.lock:
+                server.not_modified += 1
+            self.reply(304, b"", etag)
+        else:
+            with server.lock:
+                server.bytes_sent += len(body)
+            self.reply(200, body, etag)
+
+    def reply(self, status, body, etag):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class threading_server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 #the default listen backlog of 5 drops connections when every sublert thread connects at once
+
+class fake_crtsh_server(object):
+    def __init__(self, path, host = "127.0.0.1", port = 0, delay = 0.05, slow = None):
+        self.path = path
+        self.delay = delay
+        self.slow = slow or {} #apex -> delay of the domains answered slower than the others
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = threading_server((host, port), fake_crtsh_handler)
+        self.server.fake = self
+        self.url = "http://{}:{}/".format(*self.server.server_address)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Checks cert_database().lookup() against a local Postgres seeded with the crtsh_fixture certificate_identity
+# table: the pooled connections and named cursor, complete and incremental (watermark) lookups, the known names
+# left out by the query, and names that look like the domain without being under it (E.g: badtarget0.com).
+# Nothing falls back to the JSON API, a failed query is reported instead.
+# Usage: python benchmarks/lookup_harness.py --postgres host:port:dbname:user [--domains 5] [--subdomains 200] [--threads 8]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sublert
+from crtsh_fixture import crtsh_fixture
+
+def decoys(apex): #names matched by the unanchored pattern of sublert 1.4.7, or differing only in case
+    return [apex.upper(), "Mixed." + apex, "bad" + apex, "www.bad" + apex, apex + ".evil.net", "x" + apex.replace(".", "_", 1)]
+
+def adding_decoys(fixture, apex): #issued in new certificates, so incremental lookups see them as well
+    certificate_id = fixture.next_id()
+    with fixture.conn:
+        fixture.conn.executemany("INSERT INTO certificate_identity VALUES (?, 'dNSName', ?, 'decoys')",
+                                 [(certificate_id + i, name) for i, name in enumerate(decoys(apex))])
+
+def expected(fixture, apex, since = None): #names crt.sh holds under the domain, and the highest certificate ID among them
+    names, watermark = set(), since
+    for certificate_id, name in fixture.conn.execute("SELECT certificate_id, name_value FROM certificate_identity WHERE certificate_id > ?", (since or 0,)):
+        name = name.lower()
+        if name == apex or name.endswith("." + apex):
+            names.add(name)
+            watermark = max(watermark or 0, certificate_id)
+    return names, watermark
+
+def looking_up(domain, since = None, known = None):
+    database = sublert.cert_database()
+    return set(database.lookup(domain, since = since, known = known)), database.watermark
+
+def json_fallback(*args, **kwargs):
+    raise AssertionError("the Postgres lookup failed and fell back to the JSON API")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--postgres", required = True, help = "host:port:dbname:user of a local Postgres, its certificate_identity table is replaced.")
+    parser.add_argument("--domains", type = int, default = 5)
+    parser.add_argument("--subdomains", type = int, default = 200)
+    parser.add_argument("--threads", type = int, default = 8, help = "Concurrent lookups, more than the pool has connections.")
+    parser.add_argument("--pool-size", type = int, default = 3)
+    parser.add_argument("--fetch-size", type = int, default = 50, help = "Small, so every lookup streams several batches.")
+    args = parser.parse_args()
+    host, port, dbname, user = args.postgres.split(":")
+    sublert.DB_HOST, sublert.DB_PORT, sublert.DB_NAME, sublert.DB_USER = host, int(port), dbname, user
+    sublert.DB_FETCH_SIZE = args.fetch_size
+    sublert.db_pool = sublert.connection_pool(args.pool_size)
+    sublert.crtsh_cache.fetch = json_fallback
+    sublert.enable_logging = None
+
+    directory = tempfile.mkdtemp()
+    fixture = crtsh_fixture(os.path.join(directory, "crtsh.db"))
+    try:
+        domains = fixture.build(args.domains, args.subdomains)
+        for apex in domains:
+            adding_decoys(fixture, apex)
+        fixture.seed_postgres(host = host, port = int(port), dbname = dbname, user = user)
+
+        watermarks, stored = {}, {}
+        for apex in domains: #complete lookups
+            names, watermark = looking_up(apex)
+            assert (names, watermark) == expected(fixture, apex), "complete lookup of {} differs".format(apex)
+            assert apex in names and "bad" + apex not in names and apex + ".evil.net" not in names
+            watermarks[apex], stored[apex] = watermark, names
+        print("complete lookups of {} domains ok".format(len(domains)))
+
+        fixture.churn(0.05, renewal_rate = 0.1)
+        for apex in domains:
+            adding_decoys(fixture, apex)
+        fixture.seed_postgres(host = host, port = int(port), dbname = dbname, user = user)
+        for apex in domains: #incremental lookups, only names of certificates above the watermark
+            names, watermark = looking_up(apex, watermarks[apex])
+            assert (names, watermark) == expected(fixture, apex, watermarks[apex]), "incremental lookup of {} differs".format(apex)
+            assert names & stored[apex], "renewed names of {} are missing".format(apex)
+            excluded, excluded_watermark = looking_up(apex, watermarks[apex], sorted(stored[apex]))
+            assert excluded == names - stored[apex] and excluded_watermark == watermark, "known names of {} were not left out".format(apex)
+            assert excluded and excluded <= set(name for name in fixture.added if name.endswith("." + apex)) | set([apex])
+        print("incremental lookups ok, known names left out")
+
+        errors, threads = [], []
+        def concurrent(apex):
+            try:
+                assert looking_up(apex) == expected(fixture, apex)
+            except Exception as e:
+                errors.append(e)
+        for i in range(args.threads): #more lookups than connections, they wait for a free one instead of failing
+            threads.append(threading.Thread(target = concurrent, args = (domains[i % len(domains)],)))
+            threads[-1].start()
+        for t in threads:
+            t.join()
+        assert not errors, errors
+        assert len(sublert.db_pool.pool._used) == 0 and len(sublert.db_pool.pool._pool) <= args.pool_size, "connections leaked"
+        print("{} concurrent lookups over {} connections ok".format(args.threads, args.pool_size))
+
+        identities_query = sublert.identities_query
+        sublert.identities_query = lambda *args: ("SELECT broken FROM certificate_identity", None)
+        try:
+            looking_up(domains[0])
+        except AssertionError: #the failed query ends in the JSON fallback
+            pass
+        sublert.identities_query = identities_query
+        assert len(sublert.db_pool.pool._used) == 0, "the connection of the failed query wasn't returned"
+        assert looking_up(domains[0]) == expected(fixture, domains[0]), "the pool didn't recover from a failed query"
+        print("failed query: connection closed and replaced ok")
+        print("ok, {} crt.sh rows streamed".format(sublert.run_metrics.summary()["counters"].get("sublert_crtsh_rows_total", 0)))
+    finally:
+        sublert.db_pool.closeall()
+        fixture.close()
+        shutil.rmtree(directory)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Runs a --distributed round against several --worker processes on one machine, with crt.sh replaced by a
+# deterministic fake lookup. One worker crashes on its first domain so its lease has to expire and be taken over.
+# Checks that every domain was checked, and that every new subdomain was notified exactly once.
+# Usage: python benchmarks/shard_harness.py [--domains 200] [--workers 4] [--threads 4] [--delay 0.05]
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sublert
+from state_store import state_store
+
+class captured_notifier(object): #stands in for the Slack notifier
+    def __init__(self):
+        self.messages = []
+
+    def post(self, text):
+        self.messages.append(text)
+
+    def close(self):
+        pass
+
+def baseline(domain):
+    return ["www.{}".format(domain), "api.{}".format(domain)]
+
+def fake_lookup(delay, new): #returns the baseline plus `new` new subdomains, like an incremental crt.sh lookup merged with the known names
+    def lookup_with_retry(domain, since = None, known = None):
+        time.sleep(delay)
+        return ["new{}.{}".format(i, domain) for i in range(new)] + ([] if since else baseline(domain)), 2
+    return lookup_with_retry
+
+def configure(database, delay, new, lease):
+    sublert.store = state_store(database)
+    sublert.lookup_with_retry = fake_lookup(delay, new)
+    sublert.notifier = captured_notifier()
+    sublert.enable_logging = None
+    sublert.full_resync = None
+    sublert.domain_to_delete = None
+    sublert.domain_to_monitor = None
+    sublert.shard_lease = lease
+    sublert.shard_poll = 0.1
+
+def run_worker(database, threads, delay, new, lease, crash, ready):
+    sys.stdout = open(os.devnull, "w")
+    configure(database, delay, new, lease)
+    if crash: #dies while holding a lease, without finishing the domain
+        sublert.lookup_with_retry = lambda domain, since = None, known = None: os._exit(1)
+    ready.set()
+    sublert.working(threads)
+
+def run_round(args, database, new, workers):
+    configure(database, args.delay, new, args.lease)
+    start = time.time()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        sublert.distributing(args.threads, None)
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    summary = sublert.store.work_summary()
+    return elapsed, summary, sublert.notifier.messages
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", type = int, default = 200)
+    parser.add_argument("--workers", type = int, default = 4)
+    parser.add_argument("--threads", type = int, default = 4)
+    parser.add_argument("--delay", type = float, default = 0.05, help = "Simulated crt.sh latency per lookup in seconds.")
+    parser.add_argument("--lease", type = float, default = 2, help = "Lease duration in seconds.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "sublert.db")
+    domains = ["target{}.com".format(i) for i in range(args.domains)]
+    seed = state_store(database)
+    for domain in domains:
+        seed.add_domain(domain, baseline(domain), 1)
+    seed.close()
+
+    context = multiprocessing.get_context("spawn")
+    ready = [context.Event() for i in range(args.workers)]
+    processes = [context.Process(target = run_worker, args = (database, args.threads, args.delay, 3, args.lease, i == 0, ready[i]))
+                 for i in range(args.workers)]
+    try:
+        for process in processes:
+            process.start()
+        for event in ready: #spawned processes take a while to import sublert, the coordinator would check every domain alone
+            assert event.wait(60), "a worker didn't start"
+        elapsed, summary, messages = run_round(args, database, 3, args.workers)
+        checked = sum(summary.values())
+        print("round 1: {:.2f}s, {} domains checked by {} processes, {} Slack messages".format(elapsed, checked, len(summary), len(messages)))
+        for owner, count in sorted(summary.items()):
+            print("    {:<30} {} domains".format(owner, count))
+        text = "\n".join(messages)
+        for domain in domains:
+            for i in range(3):
+                assert text.count("https://new{}.{}\n".format(i, domain)) + text.count("https://new{}.{}`".format(i, domain)) == 1, \
+                    "new{}.{} was not notified exactly once".format(i, domain)
+        assert checked == len(domains), "only {} of {} domains were checked".format(checked, len(domains))
+        assert processes[0].exitcode == 1, "the crashing worker did not crash"
+
+        elapsed, summary, messages = run_round(args, database, 3, args.workers)
+        print("round 2: {:.2f}s, {} Slack messages".format(elapsed, len(messages)))
+        assert not any(":new:" in message for message in messages), "known subdomains were notified again"
+        print("ok")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        shutil.rmtree(directory)
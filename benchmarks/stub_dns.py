@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Local stub DNS server used by the benchmarks. Answers every A query with a 127.0.0.0/8 address,
+# replies NXDOMAIN for names starting with "nx" and delays each answer to simulate network latency.
+
+import asyncio
+import threading
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+class stub_protocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        request = dns.message.from_wire(data)
+        response = self.server.answer(request)
+        self.server.queries += 1
+        loop = asyncio.get_event_loop()
+        loop.call_later(self.server.delay, self.transport.sendto, response.to_wire(), addr)
+
+class stub_dns_server(object):
+    def __init__(self, host = "127.0.0.1", port = 0, delay = 0.02, wildcards = ()):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.wildcards = tuple(wildcards) #zones where any label resolves, E.g: dev.example.com
+        self.queries = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+
+    def answer(self, request):
+        response = dns.message.make_response(request)
+        question = request.question[0]
+        name = question.name.to_text().rstrip(".")
+        wildcard = any(name.endswith("." + zone) for zone in self.wildcards)
+        if name.startswith("nx") and not wildcard:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif question.rdtype == dns.rdatatype.A:
+            address = "127.0.0.1" if wildcard else "127.0.{}.{}".format(len(name) % 256, sum(map(ord, name)) % 256)
+            response.answer.append(dns.rrset.from_text(question.name, 300, "IN", "A", address))
+        return response
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: stub_protocol(self), local_addr = (self.host, self.port)))
+        self.port = transport.get_extra_info("sockname")[1]
+        self.ready.set()
+        self.loop.run_forever()
+        transport.close()
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
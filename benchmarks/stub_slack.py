@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Local stub Slack webhook used by the benchmarks. Records every accepted message and answers
+# every Nth request with a 429 and a Retry-After header to simulate Slack's rate limiting.
+
+import json
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: #python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+class stub_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keep-alive, so pooled sessions can be told apart from one connection per post
+
+    def do_POST(self):
+        server = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            limited = server.rate_limit_every and server.requests % server.rate_limit_every == 0
+            if limited:
+                server.rate_limited += 1
+            else:
+                server.messages.append(json.loads(body.decode("utf-8")))
+                server.arrivals.append(time.time())
+        if limited:
+            self.reply(429, "rate_limited", {"Retry-After": str(server.retry_after)})
+        else:
+            self.reply(200, "ok")
+
+    def reply(self, status, text, headers = {}):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class threading_server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class stub_slack_server(object):
+    def __init__(self, host = "127.0.0.1", port = 0, rate_limit_every = 5, retry_after = 1):
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.messages = []
+        self.arrivals = [] #when each message was accepted
+        self.lock = threading.Lock()
+        self.server = threading_server((host, port), stub_handler)
+        self.server.stub = self
+        self.url = "http://{}:{}/services/stub".format(*self.server.server_address)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -3,11 +3,68 @@
 # Slack webhooks for notifications
 posting_webhook = "https://hooks.slack.com/services/<secret>"
 errorlogging_webhook = "https://hooks.slack.com/services/<secret>"
-slack_sleep_enabled = True  # bypass Slack rate limit when using free workplace, switch to False if you're using Pro/Ent version.
+slack_sleep_enabled = True  # bypass Slack rate limit when using free workplace by spacing messages 1 second apart, switch to False if you're using Pro/Ent version.
 at_channel_enabled = True   # Add @channel notifications to Slack messages, switch to False if you don't want to use @channel
+removed_notification_enabled = False  # Also post subdomains that are no longer listed on crt.sh to Slack.
+slack_batch_size = 50  # Maximum number of new subdomains listed in a single Slack message.
+slack_retries = 5      # Number of times a rejected Slack message is retried, waiting as long as Slack's Retry-After header asks.
+
+# Output sinks, fed with the same new and removed subdomains as Slack as one JSON object per line (NDJSON)
+output_sinks = []        # E.g: ["-", "./output/findings.ndjson", "https://scanner.example.com/hook", "unix:/run/sublert.sock"], --sink adds more.
+sink_batch_size = 100    # Maximum number of findings written or POSTed at once.
+sink_flush_interval = 1  # Seconds a partial batch waits for more findings before it is written.
+sink_retries = 3         # Number of times a failed write or a 429/5xx answer of a webhook is retried.
 
 # crtsh postgres credentials, please leave it unchanged.
 DB_HOST = 'crt.sh'
 DB_NAME = 'certwatch'
 DB_USER = 'guest'
 DB_PASSWORD = ''
+DB_PORT = 5432
+
+# crtsh postgres tuning
+DB_POOL_SIZE = 10      # Maximum number of connections to crt.sh shared by all threads.
+DB_FETCH_SIZE = 10000  # Number of rows streamed from the server-side cursor per round trip.
+DB_EXCLUDE_KNOWN = 0  # Incremental lookups of domains with up to this many stored subdomains ask crt.sh to leave them out, 0 disables it. The names are sent with the query, it only pays off when most of them are renewed between two runs.
+
+# crt.sh JSON API cache, used when the Postgres database can't be reached
+crtsh_url = "https://crt.sh/"  # JSON API used when the Postgres database can't be reached.
+http_cache_dir = "./output/cache/"
+http_cache_ttl = 600                 # Seconds a cached response is used as is, after that it is revalidated with ETag/Last-Modified.
+http_cache_size = 500 * 1024 * 1024  # Maximum size of the cache in bytes, the oldest responses are evicted first.
+
+# Local state
+state_database = "./output/sublert.db"  # SQLite database holding the monitored domains, their subdomains and DNS results.
+import_batch_size = 100  # Baselines fetched by --import are saved in transactions of this many domains.
+
+# Metrics, written at the end of every run (and regularly in daemon mode). Set to None to disable an export.
+metrics_prometheus = "./output/metrics.prom"  # Prometheus text format, E.g: for the node_exporter textfile collector.
+metrics_json = "./output/run_summary.json"    # JSON summary of the run.
+
+# DNS resolution settings
+dns_concurrency = 100  # Maximum number of DNS queries in flight at once.
+dns_timeout = 5        # Seconds to wait for each DNS query before giving up.
+dns_negative_ttl = 86400  # Seconds NXDOMAIN and empty answers are cached, resolved names are cached as long as their records' TTL.
+dns_failure_ttl = 3600    # Seconds timeouts and server failures are cached.
+dns_wildcard_detection = True  # Probe a random label in the parent zone of each name and ignore names that only resolve through its wildcard.
+
+# Per-domain pipeline (fetch -> diff -> resolve -> notify)
+pipeline_queue_size = 100  # Domains waiting between two stages, the fetching threads wait once the diff stage is this far behind.
+pipeline_dns_threads = 2   # Domains resolved at once, each with up to dns_concurrency queries in flight.
+
+# Daemon mode (--daemon)
+daemon_interval = 86400  # Default seconds between two checks of a domain, override it per domain with -u <domain> -i <seconds>.
+daemon_jitter = 0.1      # Every interval is randomly stretched or shortened by up to this fraction so checks don't line up.
+daemon_slow_lookup = 60  # Checks slower than this many seconds halve the number of concurrent checks and spread the next ones.
+daemon_retry = 300       # Seconds before a failed check is retried, doubled after every consecutive failure up to the domain's interval.
+daemon_reload = 60  # Seconds between two reloads of the monitored domains and their schedules.
+
+# Distributed mode (--distributed / --worker), coordinated through the state database
+# The database is in WAL mode, which SQLite doesn't support on network filesystems: every process must run on the same host.
+shard_lease = 300        # Seconds a worker holds a domain without renewing it before another worker may take it over.
+shard_poll = 5           # Seconds between two looks at the shared work queue.
+shard_max_attempts = 3   # A domain whose checks keep crashing workers is given up after this many leases.
+
+# crt.sh lookup retries
+lookup_retries = 3  # Number of times a failed lookup is retried before giving up on a domain.
+lookup_backoff = 2  # Seconds to wait before the first retry, doubled after every failed attempt.
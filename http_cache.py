@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+# On-disk cache of crt.sh JSON responses with TTL, size-based eviction and ETag/Last-Modified revalidation,
+# plus an incremental parser that yields the items of a JSON array without loading the whole body.
+
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+
+NUMBER_TAIL = re.compile(u"[0-9.eE+-]*") #characters that may still continue a number cut by the end of a chunk
+
+class response_cache(object): #thread-safe, each entry is a <key>.body file next to a <key>.meta JSON file
+    def __init__(self, directory, ttl, max_size):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None #total size of the cached bodies, computed on first use
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def path(self, url, extension):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + extension)
+
+    def read_meta(self, url):
+        try:
+            with open(self.path(url, ".meta"), "r") as meta:
+                return json.load(meta)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def write_meta(self, url, meta):
+        path = self.path(url, ".meta")
+        with open(path + ".part", "w") as part:
+            json.dump(meta, part)
+        os.rename(path + ".part", path)
+
+    def fetch(self, session, url, headers = None, timeout = 30): #returns an open text stream of the body, or None when crt.sh didn't answer with a 200
+        meta = self.read_meta(url)
+        if meta and os.path.isfile(self.path(url, ".body")):
+            if time.time() - meta["stored"] < self.ttl:
+                with self.lock:
+                    self.hits += 1
+                self.touch(url)
+                return self.open(url)
+            headers = dict(headers or {})
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        else:
+            meta = None
+        response = session.get(url, headers = headers, timeout = timeout, verify = False, stream = True)
+        try:
+            if meta and response.status_code == 304: #still current, only the freshness is renewed
+                meta["stored"] = time.time()
+                self.write_meta(url, meta)
+                self.touch(url)
+                with self.lock:
+                    self.revalidated += 1
+                return self.open(url)
+            if response.status_code != 200:
+                return None
+            self.store(url, response)
+        finally:
+            response.close()
+        with self.lock:
+            self.misses += 1
+        return self.open(url)
+
+    def store(self, url, response): #the body is streamed to disk in chunks and renamed into place once complete
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self.path(url, ".body")
+        size = 0
+        with open(path + ".part", "wb") as body:
+            for chunk in response.iter_content(chunk_size = 1 << 16):
+                body.write(chunk)
+                size += len(chunk)
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan()
+            if os.path.isfile(path): #replaced below, its size was counted by scan() or by an earlier store()
+                self.size -= os.path.getsize(path)
+            os.rename(path + ".part", path)
+            self.write_meta(url, {"url": url, "stored": time.time(), "size": size,
+                                  "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")})
+            self.size += size
+            self.evict(keep = path)
+
+    def touch(self, url): #evict() goes by the body's mtime, a used entry moves to the back of the line
+        try:
+            os.utime(self.path(url, ".body"), None)
+        except OSError:
+            pass
+
+    def scan(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory) if name.endswith(".body"))
+
+    def evict(self, keep): #removes the least recently used entries until the cache fits in max_size, called with the lock held
+        if self.size <= self.max_size:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body") and os.path.join(self.directory, name) != keep:
+                path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(path), path))
+        for mtime, path in sorted(entries):
+            if self.size <= self.max_size:
+                break
+            self.size -= os.path.getsize(path)
+            for extension in (".body", ".meta"):
+                try:
+                    os.remove(path[:-len(".body")] + extension)
+                except OSError:
+                    pass
+            self.evicted += 1
+
+    def clear(self):
+        with self.lock:
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith((".body", ".meta", ".part")):
+                        os.remove(os.path.join(self.directory, name))
+            self.size = 0
+
+    def open(self, url):
+        return io.open(self.path(url, ".body"), "r", encoding = "utf-8")
+
+def iter_json_array(stream, chunk_size = 1 << 16): #yields the items of a top-level JSON array, only one chunk and one item are held in memory
+    decoder = json.JSONDecoder()
+    buffer = u""
+    position = 0
+    eof = False
+    state = "start" #start -> first item or end -> separator -> item -> separator ...
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if state == "start":
+                if char != u"[":
+                    raise ValueError("Expected a JSON array")
+                state, position = "first", position + 1
+                continue
+            if char == u"]" and state in ("first", "separator"):
+                return
+            if state == "separator":
+                if char != u",":
+                    raise ValueError("Expected ',' or ']' at offset {}".format(position))
+                state, position = "item", position + 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                if eof or NUMBER_TAIL.match(buffer, end).end() < len(buffer): #a value followed only by number characters may be a truncated number, E.g: 1. then 25
+                    yield item
+                    state, position = "separator", end
+                    continue
+        elif eof:
+            raise ValueError("Unterminated JSON array")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Run instrumentation: per-stage timing histograms and counters, exported in the Prometheus text format and
+# as a JSON run summary, plus a cProfile wrapper that also covers worker threads.
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300) #seconds
+
+class histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) #the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q): #estimated from the buckets with linear interpolation, like Prometheus' histogram_quantile()
+        if not self.count:
+            return 0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+class metrics_registry(object): #thread-safe, counters are keyed by name and stage durations by stage
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.stages = {}
+
+    def inc(self, name, value = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value): #for totals kept elsewhere, E.g: the crt.sh cache statistics
+        with self.lock:
+            self.counters[name] = value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = histogram()
+            self.stages[stage].observe(seconds)
+
+    def timer(self, stage): #with metrics.timer("diff"): ...
+        return stage_timer(self, stage)
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for name in sorted(self.counters):
+                lines.append("# TYPE {} counter".format(name))
+                lines.append("{} {}".format(name, self.counters[name]))
+            lines.append("# TYPE sublert_stage_seconds histogram")
+            for stage in sorted(self.stages):
+                stats = self.stages[stage]
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in BUCKETS] + ["+Inf"], stats.counts):
+                    cumulative += count
+                    lines.append('sublert_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, cumulative))
+                lines.append('sublert_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(stage, stats.sum))
+                lines.append('sublert_stage_seconds_count{{stage="{}"}} {}'.format(stage, stats.count))
+            lines.append("# TYPE sublert_run_seconds gauge")
+            lines.append("sublert_run_seconds {:.3f}".format(time.time() - self.started))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        with self.lock:
+            return {"started": self.started,
+                    "duration": time.time() - self.started,
+                    "counters": dict(self.counters),
+                    "stages": dict((stage, {"count": stats.count, "seconds": stats.sum, "max": stats.max,
+                                            "mean": stats.sum / stats.count if stats.count else 0,
+                                            "p50": stats.quantile(0.5), "p95": stats.quantile(0.95), "p99": stats.quantile(0.99)})
+                                   for stage, stats in self.stages.items())}
+
+    def write(self, prometheus_path, json_path): #both files are replaced atomically so collectors never read a partial export
+        for path, content in ((prometheus_path, self.prometheus()), (json_path, json.dumps(self.summary(), indent = 2, sort_keys = True))):
+            if path:
+                with open(path + ".part", "w") as export:
+                    export.write(content)
+                os.rename(path + ".part", path)
+
+class stage_timer(object):
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.time() - self.start)
+
+class run_profiler(object): #before python 3.12 cProfile only sees the thread it was enabled in, so every thread gets its own profile and they are merged
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = None
+        self.main = cProfile.Profile()
+        self.per_thread = sys.version_info < (3, 12) #from 3.12 on the single profile sees every thread and a second one can't be enabled
+
+    def start(self):
+        self.main.enable()
+
+    def wrap(self, target):
+        if not self.per_thread:
+            return target
+        def run(*args):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError: #another profiling tool is already active, the thread runs unprofiled
+                return target(*args)
+            try:
+                return target(*args)
+            finally:
+                profile.disable()
+                self.add(profile)
+        return run
+
+    def add(self, profile):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def stop(self, path, limit = 25): #dumps the merged profile for pstats/snakeviz and prints the hot paths
+        self.main.disable()
+        self.add(self.main)
+        self.stats.dump_stats(path)
+        self.stats.sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Per-domain scheduling used by the daemon mode: every domain is checked on its own interval with jitter,
+# due domains are handed out by priority and concurrency shrinks while crt.sh is slow or failing.
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+class scheduler(object):
+    def __init__(self, max_in_flight, default_interval, jitter = 0.1, slow = 60, retry = 300):
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = self.max_in_flight #current number of concurrent checks, adapted to crt.sh latency
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.slow = slow
+        self.retry = retry #seconds before a failed check is retried, doubled after every consecutive failure
+        self.failures = {} #domain -> number of consecutive failed checks
+        self.latency = None #moving average of the check duration
+        self.entries = {} #domain -> (interval, priority)
+        self.tokens = {} #domain -> id of its only valid heap entry, older entries are skipped when popped
+        self.waiting = [] #(due, token, domain), ordered by due time
+        self.ready = [] #(-priority, due, token, domain), due domains ordered by priority
+        self.in_flight = set()
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def sync(self, schedules): #(domain, interval, priority, last check time) of every monitored domain, removed domains are dropped
+        now = time.time()
+        with self.condition:
+            entries = {}
+            for domain, interval, priority, checked in schedules:
+                entries[domain] = (interval or self.default_interval, priority or 0)
+                if self.entries.get(domain) != entries[domain] and domain not in self.in_flight: #new domain or changed schedule
+                    self.push(domain, checked + entries[domain][0] if checked else now, entries[domain][1])
+            for domain in set(self.entries) - set(entries):
+                self.tokens.pop(domain, None)
+            self.entries = entries
+            self.condition.notify_all()
+
+    def push(self, domain, due, priority):
+        token = next(self.counter)
+        self.tokens[domain] = token
+        heapq.heappush(self.waiting, (due, token, domain))
+
+    def acquire(self): #blocks until a domain is due and the concurrency limit allows checking it, returns None once stopped
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+                while self.waiting and self.waiting[0][0] <= now:
+                    due, token, domain = heapq.heappop(self.waiting)
+                    if self.tokens.get(domain) == token:
+                        heapq.heappush(self.ready, (-self.entries[domain][1], due, token, domain))
+                while self.ready and self.tokens.get(self.ready[0][3]) != self.ready[0][2]:
+                    heapq.heappop(self.ready)
+                if self.ready and len(self.in_flight) < self.limit:
+                    domain = heapq.heappop(self.ready)[3]
+                    del self.tokens[domain]
+                    self.in_flight.add(domain)
+                    return domain
+                timeout = self.waiting[0][0] - now if self.waiting and not self.ready else None
+                self.condition.wait(timeout)
+        return None
+
+    def release(self, domain, elapsed, ok): #reschedules a checked domain and adapts the concurrency limit
+        with self.condition:
+            self.in_flight.discard(domain)
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            if not ok or elapsed > self.slow:
+                self.limit = max(1, self.limit // 2)
+            elif self.latency < self.slow / 2:
+                self.limit = min(self.max_in_flight, self.limit + 1)
+            self.failures[domain] = 0 if ok else self.failures.get(domain, 0) + 1
+            if domain in self.entries:
+                interval, priority = self.entries[domain]
+                if not ok: #retried soon, a crt.sh outage mustn't skip the domain for a whole interval
+                    delay = min(interval, self.retry * 2 ** (self.failures[domain] - 1)) * random.uniform(1 - self.jitter, 1)
+                else:
+                    delay = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                    if self.latency > self.slow: #crt.sh is struggling, spread the checks further apart
+                        delay *= self.latency / self.slow
+                self.push(domain, time.time() + delay, priority)
+            else:
+                self.failures.pop(domain, None)
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
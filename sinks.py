@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Machine-readable outputs fed with the same findings as Slack. Every new or removed subdomain becomes one JSON
+# object on its own line (NDJSON), streamed to stdout or a file, POSTed in batches to an HTTP webhook, or written
+# to a Unix socket, so scanners can pick up findings without polling Slack.
+
+import json
+import socket
+import sys
+import threading
+import time
+import requests
+from slack_notifier import retry_after
+try:
+    import queue
+except ImportError: #python 2.x
+    import Queue as queue
+
+class sink_error(Exception): #raised by write(), retry = False gives up on the batch right away
+    def __init__(self, message, retry = True, delay = None):
+        Exception.__init__(self, message)
+        self.retry = retry
+        self.delay = delay
+
+def encode_events(change, domain, subdomains, dns_result = None): #one NDJSON line per subdomain, E.g: {"change": "new", "domain": "example.com", "subdomain": "api.example.com", "dns": {"A": ["1.2.3.4"]}, "time": 1600000000.0}
+    now = round(time.time(), 3)
+    lines = []
+    for subdomain in subdomains:
+        event = {"change": change, "domain": domain, "subdomain": subdomain, "time": now}
+        if dns_result is not None:
+            event["dns"] = dns_result.get(subdomain, {})
+        lines.append(json.dumps(event, sort_keys = True) + "\n")
+    return lines
+
+class output_sink(object): #lines are queued by emit() and written in batches by a single background thread per sink
+    def __init__(self, name, batch_size = 100, flush_interval = 1.0, retries = 3, on_error = None, metrics = None):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval #seconds a partial batch waits for more lines
+        self.retries = retries
+        self.on_error = on_error
+        self.metrics = metrics #optional metrics_registry, every write is timed as the "sink" stage
+        self.lines = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+
+    def emit(self, lines): #returns right away, the lines are written by the background thread
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run)
+                self.thread.daemon = True
+                self.thread.start()
+        for line in lines:
+            self.lines.put(line)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            line = self.lines.get()
+            if line is None:
+                break
+            batch = [line]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size: #a batch is written once it is full or once the flush interval passed
+                try:
+                    line = self.lines.get(timeout = max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if line is None:
+                    stopping = True
+                    break
+                batch.append(line)
+            self.deliver(batch)
+
+    def deliver(self, batch):
+        error = None
+        for attempt in range(self.retries + 1):
+            start = time.time()
+            try:
+                self.write("".join(batch))
+            except sink_error as e:
+                error = e
+                if not e.retry:
+                    break
+            else:
+                if self.metrics:
+                    self.metrics.observe("sink", time.time() - start)
+                self.delivered += len(batch)
+                return True
+            if attempt < self.retries:
+                time.sleep(error.delay if error.delay is not None else 2 ** attempt)
+        self.failed += len(batch)
+        if self.on_error:
+            self.on_error("Writing {} findings to {} failed: {}".format(len(batch), self.name, error))
+        return False
+
+    def write(self, data): #writes a batch of NDJSON lines or raises sink_error
+        raise NotImplementedError
+
+    def close(self): #waits until every queued line was written
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.lines.put(None)
+            thread.join()
+        self.release()
+
+    def release(self):
+        pass
+
+class ndjson_sink(output_sink): #appends to a file, or writes to stdout when the path is -
+    def __init__(self, path, **options):
+        output_sink.__init__(self, "stdout" if path == "-" else path, **options)
+        self.stdout = path == "-"
+        self.output = sys.stdout if self.stdout else None #taken before sublert moves its own messages to stderr
+        self.path = path
+
+    def write(self, data):
+        try:
+            if self.output is None:
+                self.output = open(self.path, "a")
+            self.output.write(data)
+            self.output.flush() #readers tailing the file see every batch right away
+        except (IOError, OSError, ValueError) as e:
+            raise sink_error(str(e))
+
+    def release(self):
+        if self.output is not None and not self.stdout:
+            self.output.close()
+            self.output = None
+
+class webhook_sink(output_sink): #POSTs every batch as an application/x-ndjson body over a keep-alive session
+    def __init__(self, url, **options):
+        output_sink.__init__(self, url, **options)
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/x-ndjson'})
+
+    def write(self, data):
+        try:
+            response = self.session.post(self.url, data = data.encode("utf-8"), timeout = 30)
+        except requests.RequestException as e:
+            raise sink_error("request failed: {}".format(e))
+        if response.status_code >= 300:
+            error = "error {}, the response is:\n{}".format(response.status_code, response.text[:200])
+            if response.status_code != 429 and response.status_code < 500: #the webhook rejects the payload, retrying won't help
+                raise sink_error(error, retry = False)
+            raise sink_error(error, delay = retry_after(response, None))
+
+    def release(self):
+        self.session.close()
+
+class socket_sink(output_sink): #streams to a listening Unix socket, reconnects when the reader went away
+    def __init__(self, path, **options):
+        output_sink.__init__(self, "unix:" + path, **options)
+        self.path = path
+        self.connection = None
+
+    def write(self, data):
+        try:
+            if self.connection is None:
+                self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.connection.settimeout(30)
+                self.connection.connect(self.path)
+            self.connection.sendall(data.encode("utf-8"))
+        except (socket.error, IOError, OSError) as e:
+            self.release()
+            raise sink_error(str(e))
+
+    def release(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def opening_sink(spec, **options): #E.g: - (stdout), ./output/findings.ndjson, https://scanner.example.com/hook, unix:/run/sublert.sock
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return webhook_sink(spec, **options)
+    if spec.startswith("unix:"):
+        return socket_sink(spec[len("unix:"):], **options)
+    if spec.startswith("file:"):
+        spec = spec[len("file:"):]
+    return ndjson_sink(spec, **options)
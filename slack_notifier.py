@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Background delivery of Slack webhook messages over a pooled session, honoring Slack's Retry-After header.
+
+import json
+import threading
+import time
+import requests
+try:
+    import queue
+except ImportError: #python 2.x
+    import Queue as queue
+
+class slack_notifier(object): #messages are queued by post() and delivered in order by a single background thread
+    def __init__(self, webhook_url, retries = 5, min_interval = 0, on_error = None, metrics = None):
+        self.webhook_url = webhook_url
+        self.retries = retries
+        self.min_interval = min_interval #seconds between two posts, Slack allows about one message per second per webhook
+        self.on_error = on_error
+        self.metrics = metrics #optional metrics_registry, every post is timed as the "slack" stage
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self.messages = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.next_post = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+
+    def post(self, text): #returns right away, the message is delivered by the background thread
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run)
+                self.thread.daemon = True
+                self.thread.start()
+        self.messages.put({'text': text})
+
+    def run(self):
+        while True:
+            payload = self.messages.get()
+            if payload is None:
+                break
+            self.deliver(payload)
+
+    def deliver(self, payload):
+        error = None
+        for attempt in range(self.retries + 1):
+            delay = 2 ** attempt
+            wait = self.next_post - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_post = time.time() + self.min_interval
+            start = time.time()
+            try:
+                response = self.session.post(self.webhook_url, data = json.dumps(payload), timeout = 30)
+            except requests.RequestException as e:
+                error = "Request to slack failed: {}".format(e)
+            else:
+                if self.metrics:
+                    self.metrics.observe("slack", time.time() - start)
+                if response.status_code == 200:
+                    self.delivered += 1
+                    return True
+                error = "Request to slack returned an error {}, the response is:\n{}".format(response.status_code, response.text)
+                if response.status_code != 429 and response.status_code < 500: #the payload or the webhook is wrong, retrying won't help
+                    break
+                delay = retry_after(response, delay)
+            if attempt < self.retries:
+                self.retried += 1
+                time.sleep(delay)
+        self.failed += 1
+        if self.on_error:
+            self.on_error(error)
+        return False
+
+    def close(self): #waits until every queued message was delivered
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.messages.put(None)
+            thread.join()
+        self.session.close()
+
+def retry_after(response, default): #seconds Slack asks us to wait, falls back to the default when the header is missing or is a date
+    try:
+        return max(0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# coding: utf-8
+# SQLite backed storage of the monitored domains, their subdomains, crt.sh watermarks and DNS results.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    watermark INTEGER,
+    checked REAL,
+    poll_interval INTEGER,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS subdomains (
+    domain TEXT NOT NULL,
+    subdomain TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (domain, subdomain)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetched (
+    domain TEXT NOT NULL,
+    subdomain TEXT NOT NULL,
+    PRIMARY KEY (domain, subdomain)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pending (
+    domain TEXT PRIMARY KEY,
+    watermark INTEGER,
+    complete INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS work (
+    domain TEXT PRIMARY KEY,
+    complete INTEGER NOT NULL,
+    owner TEXT,
+    expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dns_cache (
+    name TEXT PRIMARY KEY,
+    records TEXT NOT NULL,
+    status TEXT NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+'''
+
+DROPPED = ["dns"] #DNS results of notified subdomains, written but never read, dns_cache holds them
+COLUMNS = [("domains", "poll_interval", "INTEGER"), ("domains", "priority", "INTEGER NOT NULL DEFAULT 0")] #added after the first release of the schema
+
+class state_store(object): #thread-safe, every public method runs in its own transaction
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout = 60, check_same_thread = False) #waits for other processes sharing the database
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        for table in DROPPED:
+            self.conn.execute("DROP TABLE IF EXISTS {}".format(table))
+        for table, column, definition in COLUMNS: #upgrades databases created by an older version
+            if column not in [row[1] for row in self.conn.execute("PRAGMA table_info({})".format(table))]:
+                self.conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+
+    def domains(self): #monitored domains in the order they were added
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT domain FROM domains ORDER BY rowid")]
+
+    def is_monitored(self, domain):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM domains WHERE domain = ?", (domain,)).fetchone() is not None
+
+    def has_baseline(self, domain): #checked stays NULL until the first complete lookup was saved
+        with self.lock:
+            row = self.conn.execute("SELECT checked FROM domains WHERE domain = ?", (domain,)).fetchone()
+            return row is not None and row[0] is not None
+
+    def watermark(self, domain):
+        with self.lock:
+            row = self.conn.execute("SELECT watermark FROM domains WHERE domain = ?", (domain,)).fetchone()
+            return row[0] if row else None
+
+    def subdomains(self, domain, limit = None): #stored subdomains of a domain, None when there are more than limit
+        with self.lock:
+            names = [row[0] for row in self.conn.execute("SELECT subdomain FROM subdomains WHERE domain = ? LIMIT ?", (domain, -1 if limit is None else limit + 1))]
+        return None if limit is not None and len(names) > limit else names
+
+    def schedules(self): #(domain, poll interval or None for the default, priority, last check time or None) of every monitored domain
+        with self.lock:
+            return self.conn.execute("SELECT domain, poll_interval, priority, checked FROM domains ORDER BY rowid").fetchall()
+
+    def set_schedule(self, domain, poll_interval = None, priority = None): #arguments left to None keep their current value
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE domains SET poll_interval = COALESCE(?, poll_interval), priority = COALESCE(?, priority) WHERE domain = ?", (poll_interval, priority, domain))
+
+    def add_domain(self, domain, subdomains, watermark = None): #saves the baseline of a new or not yet checked domain
+        self.add_baselines([(domain, subdomains, watermark)])
+
+    def add_baselines(self, baselines): #(domain, subdomains, watermark) of several domains, saved in one transaction
+        now = time.time()
+        with self.lock, self.conn:
+            for domain, subdomains, watermark in baselines:
+                self.conn.execute("INSERT OR IGNORE INTO domains (domain) VALUES (?)", (domain,))
+                self.conn.execute("UPDATE domains SET watermark = ?, checked = ? WHERE domain = ?", (watermark, now, domain))
+                self.conn.executemany("INSERT OR IGNORE INTO subdomains VALUES (?, ?, ?, ?)", ((domain, subdomain, now, now) for subdomain in subdomains))
+
+    def add_domains(self, domains, poll_interval = None, priority = None): #monitors several domains without a baseline yet, returns how many were new
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO domains (domain) VALUES (?)", ((domain,) for domain in domains))
+            added = self.conn.total_changes - before
+            if poll_interval is not None or priority is not None:
+                self.conn.executemany("UPDATE domains SET poll_interval = COALESCE(?, poll_interval), priority = COALESCE(?, priority) WHERE domain = ?",
+                                      ((poll_interval, priority, domain) for domain in domains))
+        return added
+
+    def without_baseline(self): #monitored domains whose first complete lookup wasn't saved yet, E.g: after an interrupted import
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT domain FROM domains WHERE checked IS NULL ORDER BY rowid")]
+
+    def remove_domain(self, domain):
+        with self.lock, self.conn:
+            removed = self.conn.execute("DELETE FROM domains WHERE domain = ?", (domain,)).rowcount
+            for table in ("subdomains", "fetched", "pending", "work"):
+                self.conn.execute("DELETE FROM {} WHERE domain = ?".format(table), (domain,))
+        return removed > 0
+
+    def reset(self):
+        with self.lock, self.conn:
+            for table in ("domains", "subdomains", "fetched", "pending", "dns_cache", "work", "leases"):
+                self.conn.execute("DELETE FROM {}".format(table))
+
+    def stage(self, domain, subdomains, watermark, complete): #result of a lookup, kept apart until rotate() accepts it
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fetched WHERE domain = ?", (domain,))
+            self.conn.executemany("INSERT OR IGNORE INTO fetched VALUES (?, ?)", ((domain, subdomain) for subdomain in subdomains))
+            self.conn.execute("INSERT OR REPLACE INTO pending VALUES (?, ?, ?)", (domain, watermark, int(bool(complete))))
+
+    def staged_domains(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT domain FROM pending ORDER BY domain")]
+
+    def changes(self, domain): #new and removed subdomains of a staged lookup, an incremental lookup can't tell about removed ones
+        with self.lock:
+            added = [row[0] for row in self.conn.execute(
+                "SELECT f.subdomain FROM fetched f WHERE f.domain = ? AND NOT EXISTS "
+                "(SELECT 1 FROM subdomains s WHERE s.domain = f.domain AND s.subdomain = f.subdomain) ORDER BY f.subdomain", (domain,))]
+            removed = [row[0] for row in self.conn.execute(
+                "SELECT s.subdomain FROM subdomains s JOIN pending p ON p.domain = s.domain AND p.complete WHERE s.domain = ? AND NOT EXISTS "
+                "(SELECT 1 FROM fetched f WHERE f.domain = s.domain AND f.subdomain = s.subdomain) ORDER BY s.subdomain", (domain,))]
+        return added, removed
+
+    def prune(self, domain): #drops the stored subdomains a complete staged lookup no longer lists, once they were reported as removed
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM subdomains WHERE domain = ? AND EXISTS (SELECT 1 FROM pending WHERE domain = ? AND complete) "
+                              "AND subdomain NOT IN (SELECT subdomain FROM fetched WHERE domain = ?)", (domain, domain, domain))
+
+    def rotate(self, domains): #accepts the staged lookups of the given domains, all in one transaction
+        now = time.time()
+        with self.lock, self.conn:
+            for domain in domains:
+                row = self.conn.execute("SELECT watermark, complete FROM pending WHERE domain = ?", (domain,)).fetchone()
+                if row is None:
+                    continue
+                watermark, complete = row
+                if complete:
+                    self.conn.execute("DELETE FROM subdomains WHERE domain = ? AND subdomain NOT IN (SELECT subdomain FROM fetched WHERE domain = ?)", (domain, domain))
+                self.conn.execute("UPDATE subdomains SET last_seen = ? WHERE domain = ? AND subdomain IN (SELECT subdomain FROM fetched WHERE domain = ?)", (now, domain, domain))
+                self.conn.execute("INSERT OR IGNORE INTO subdomains SELECT domain, subdomain, ?, ? FROM fetched WHERE domain = ?", (now, now, domain))
+                self.conn.execute("UPDATE domains SET watermark = COALESCE(?, watermark), checked = ? WHERE domain = ?", (watermark, now, domain))
+                self.conn.execute("DELETE FROM fetched WHERE domain = ?", (domain,))
+                self.conn.execute("DELETE FROM pending WHERE domain = ?", (domain,))
+
+    def discard(self, domain = None): #drops staged lookups, the next run fetches them again from the same watermark
+        with self.lock, self.conn:
+            if domain is None:
+                self.conn.execute("DELETE FROM fetched")
+                self.conn.execute("DELETE FROM pending")
+            else:
+                self.conn.execute("DELETE FROM fetched WHERE domain = ?", (domain,))
+                self.conn.execute("DELETE FROM pending WHERE domain = ?", (domain,))
+
+    def cached_dns(self, names): #name -> (records, status) of the cached DNS results that didn't expire yet
+        now = time.time()
+        cached = {}
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM dns_cache WHERE expires <= ?", (now,))
+            for i in range(0, len(names), 500): #stays below SQLite's limit on the number of parameters
+                chunk = names[i:i + 500]
+                for name, records, status in self.conn.execute(
+                        "SELECT name, records, status FROM dns_cache WHERE name IN ({})".format(", ".join("?" * len(chunk))), chunk):
+                    cached[name] = (json.loads(records), status)
+        return cached
+
+    def cache_dns(self, entries): #(name, records, status, expiry time) of fresh DNS results
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO dns_cache VALUES (?, ?, ?, ?)",
+                                  ((name, json.dumps(records), status, expires) for name, records, status, expires in entries))
+
+    def exclusive(self, statements): #runs statements(conn) in a write transaction taken before reading, so other processes can't claim the same row
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.conn)
+            except:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            return result
+
+    def acquire_lease(self, name, owner, duration): #returns False while another owner holds an unexpired lease
+        now = time.time()
+        def statements(conn):
+            row = conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, owner, now + duration))
+            return True
+        return self.exclusive(statements)
+
+    def release_lease(self, name, owner):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def enqueue(self, domains, complete = False): #replaces the shared work queue with a new round of domains
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM work")
+            self.conn.executemany("INSERT INTO work (domain, complete) VALUES (?, ?)", ((domain, int(bool(complete))) for domain in domains))
+
+    def claim(self, owner, duration, max_attempts): #leases the next unfinished domain whose lease is free or expired, returns (domain, complete) or None
+        now = time.time()
+        def statements(conn):
+            row = conn.execute("SELECT domain, complete FROM work WHERE done = 0 AND attempts < ? AND (owner IS NULL OR expires < ?) "
+                               "ORDER BY attempts, rowid LIMIT 1", (max_attempts, now)).fetchone()
+            if row:
+                conn.execute("UPDATE work SET owner = ?, expires = ?, attempts = attempts + 1 WHERE domain = ?", (owner, now + duration, row[0]))
+            return row
+        return self.exclusive(statements)
+
+    def renew(self, domain, owner, duration): #returns False when the lease expired and was taken over by another owner
+        with self.lock, self.conn:
+            return self.conn.execute("UPDATE work SET expires = ? WHERE domain = ? AND owner = ? AND done = 0", (time.time() + duration, domain, owner)).rowcount > 0
+
+    def finish(self, domain, owner):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE work SET done = 1 WHERE domain = ? AND owner = ?", (domain, owner))
+
+    def work_left(self, max_attempts): #domains that are still queued or being checked, domains that used up their attempts are given up
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM work WHERE done = 0 AND (attempts < ? OR expires >= ?)", (max_attempts, time.time())).fetchone()[0]
+
+    def work_summary(self): #owner -> number of domains it finished
+        with self.lock:
+            return dict(self.conn.execute("SELECT owner, COUNT(*) FROM work WHERE done = 1 GROUP BY owner").fetchall())
+
+    def migrate(self, domains_file, output_dir): #one-time import of domains.txt and ./output/<domain>.txt|.mark, returns the number of imported domains
+        with self.lock:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0]:
+                return 0
+        imported = 0
+        if os.path.isfile(domains_file):
+            with open(domains_file, "r") as targets:
+                domains = [line.strip().lower() for line in targets if line.strip()]
+            for domain in domains:
+                with self.lock, self.conn:
+                    self.conn.execute("INSERT OR IGNORE INTO domains (domain) VALUES (?)", (domain,))
+                imported += 1
+                path = os.path.join(output_dir, domain + ".txt")
+                if not os.path.isfile(path): #monitored without a baseline, the next run fetches it
+                    continue
+                with open(path, "r") as subdomains:
+                    names = set(line.strip() for line in subdomains if line.strip())
+                watermark = None
+                try:
+                    with open(os.path.join(output_dir, domain + ".mark"), "r") as mark:
+                        watermark = int(mark.read().strip())
+                except (IOError, OSError, ValueError):
+                    pass
+                self.add_domain(domain, names, watermark)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA user_version = 1")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compact sorted set of subdomains holding the answer of a crt.sh lookup until it is staged in the state database,
+# which computes the diff. Names are stored with their labels reversed (api.example.com -> com.example.api) so
+# siblings sort next to each other, and front coded in one contiguous buffer: every entry only keeps the bytes
+# that differ from the previous one.
+
+import heapq
+
+CHUNK = 100000 #names sorted at once by index_builder, larger inputs are sorted in runs which are then merged
+
+def index_key(name): #api.example.com -> b"com.example.api"
+    return ".".join(reversed(name.split("."))).encode("utf-8")
+
+def index_name(key):
+    return ".".join(reversed(key.decode("utf-8").split(".")))
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def shared_prefix(previous, key): #the first differing byte is found by XORing both keys as big integers, which runs in C
+    length = min(len(previous), len(key))
+    difference = int.from_bytes(previous[:length], "big") ^ int.from_bytes(key[:length], "big")
+    return length - (difference.bit_length() + 7) // 8
+
+if not hasattr(int, "from_bytes"): #python 2.x
+    def shared_prefix(previous, key):
+        length = min(len(previous), len(key))
+        i = 0
+        while i < length and previous[i] == key[i]:
+            i += 1
+        return i
+
+class subdomain_index(object): #immutable, build it with index_builder or from_sorted_keys()
+    def __init__(self, data = None, count = 0):
+        self.data = data if data is not None else bytearray()
+        self.count = count
+
+    @classmethod
+    def from_sorted_keys(cls, keys): #keys must be sorted, duplicates are skipped
+        data = bytearray()
+        previous = None
+        count = 0
+        for key in keys:
+            if key == previous:
+                continue
+            shared = shared_prefix(previous, key) if previous is not None else 0
+            if shared < 0x80 and len(key) - shared < 0x80: #the usual case, both fit in one byte
+                data.append(shared)
+                data.append(len(key) - shared)
+            else:
+                write_varint(data, shared)
+                write_varint(data, len(key) - shared)
+            data += key[shared:]
+            previous = key
+            count += 1
+        return cls(data, count)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self): #names in index order, decoded one at a time
+        for key in self.keys():
+            yield index_name(key)
+
+    def keys(self): #encoded keys in sorted order
+        data = self.data
+        position, end = 0, len(self.data)
+        previous = b""
+        while position < end:
+            shared, position = read_varint(data, position)
+            length, position = read_varint(data, position)
+            previous = previous[:shared] + bytes(data[position:position + length])
+            position += length
+            yield previous
+
+    def union(self, *others): #new index holding the names of every index
+        return subdomain_index.from_sorted_keys(heapq.merge(self.keys(), *[other.keys() for other in others]))
+
+class index_builder(object): #collects names in any order and duplicates, only CHUNK of them are held as Python objects at once
+    def __init__(self, chunk = CHUNK):
+        self.chunk = chunk
+        self.pending = []
+        self.runs = []
+
+    def add(self, name):
+        self.pending.append(index_key(name))
+        if len(self.pending) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.pending.sort()
+            self.runs.append(subdomain_index.from_sorted_keys(self.pending))
+            self.pending = []
+
+    def finish(self):
+        self.flush()
+        if not self.runs:
+            return subdomain_index()
+        if len(self.runs) == 1:
+            return self.runs[0]
+        return self.runs[0].union(*self.runs[1:])
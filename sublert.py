@@ -8,14 +8,28 @@ import dns.resolver
 import sys
 import requests
 import json
-import difflib
 import os
-import re
 import psycopg2
+import psycopg2.pool
+import sqlite3
 from tld import get_fld
 from tld.utils import update_tld_names
 from termcolor import colored
 import threading
+import signal
+import socket
+from state_store import state_store
+from slack_notifier import slack_notifier
+from sinks import opening_sink, encode_events
+from scheduler import scheduler
+from http_cache import response_cache, iter_json_array
+from suffix_matcher import suffix_matcher
+from subdomain_index import index_builder
+from metrics import metrics_registry, run_profiler
+try:
+    import async_resolver #asyncio DNS engine, requires python 3 and dnspython >= 2.0
+except (ImportError, SyntaxError):
+    async_resolver = None
 is_py2 = sys.version[0] == "2" #checks if python version used == 2 in order to properly handle import of Queue module depending on the version used.
 if is_py2:
     import Queue as queue
@@ -23,8 +37,9 @@ else:
     import queue as queue
 from config import *
 import time
+import random
 
-version = "1.4.7"
+version = "1.5.0"
 requests.packages.urllib3.disable_warnings()
 
 def banner():
@@ -44,6 +59,11 @@ def parse_args():
                             dest = "target",
                             help = "Domain to monitor. E.g: yahoo.com",
                             required = False)
+        parser.add_argument('--import',
+                            dest = "import_file",
+                            help = "Bulk import the domains listed in a file (- for stdin) and fetch their baselines concurrently, run it again to resume an interrupted import.",
+                            metavar = "FILE",
+                            required = False)
         parser.add_argument("-q", "--question",
                             type=string_to_bool, nargs='?',
                             const=True, default=True,
@@ -63,6 +83,16 @@ def parse_args():
                             required=False,
                             nargs='?',
                             const="True")
+        parser.add_argument('--resolvers',
+                            dest = "resolvers",
+                            help = "Comma-separated list or file of DNS resolvers to spread queries across. E.g: 1.1.1.1,8.8.8.8:53",
+                            required = False)
+        parser.add_argument('--sink',
+                            dest = "sinks",
+                            help = "Also stream new and removed subdomains as NDJSON to - (stdout), a file, an http(s):// webhook or unix:/path/to.sock, can be repeated. Default: output_sinks in config.py",
+                            action = "append",
+                            metavar = "SINK",
+                            required = False)
         parser.add_argument('-l', '--logging',
                             dest = "logging",
                             help = "Enable Slack-based error logging.",
@@ -75,6 +105,46 @@ def parse_args():
                             required =  False,
                             nargs='?',
                             const="True")
+        parser.add_argument('-f', '--full-resync',
+                            dest = "full_resync",
+                            help = "Ignore the stored watermarks and fetch the complete certificate history of every domain.",
+                            required = False,
+                            nargs='?',
+                            const="True")
+        parser.add_argument('--daemon',
+                            dest = "daemon",
+                            help = "Keep running and check every monitored domain on its own interval.",
+                            required = False,
+                            nargs='?',
+                            const="True")
+        parser.add_argument('--distributed',
+                            dest = "distributed",
+                            help = "Share this run's domains with --worker processes through the state database, then diff and notify centrally.",
+                            required = False,
+                            nargs='?',
+                            const="True")
+        parser.add_argument('--worker',
+                            dest = "worker",
+                            help = "Keep running and check the domains handed out by --distributed runs.",
+                            required = False,
+                            nargs='?',
+                            const="True")
+        parser.add_argument('-i', '--interval',
+                            dest = "interval",
+                            help = "Seconds between two checks of the domain given with -u in daemon mode. Default: daemon_interval in config.py",
+                            type = int,
+                            required = False)
+        parser.add_argument('-p', '--priority',
+                            dest = "priority",
+                            help = "Priority of the domain given with -u in daemon mode, higher values are checked first when several domains are due.",
+                            type = int,
+                            required = False)
+        parser.add_argument('--profile',
+                            dest = "profile",
+                            help = "Profile the run with cProfile, print the hot paths and save the stats to the given file.",
+                            required = False,
+                            nargs='?',
+                            const="./output/sublert.prof")
         parser.add_argument('-m', '--reset',
                             dest = "reset",
                             help = "Reset everything.",
@@ -93,51 +163,58 @@ def domain_sanity_check(domain): #Verify the domain name sanity
     else:
         pass
 
-def slack(data): #posting to Slack
-    webhook_url = posting_webhook
-    slack_data = {'text': data}
-    response = requests.post(
-                        webhook_url,
-                        data = json.dumps(slack_data),
-                        headers = {'Content-Type': 'application/json'}
-                            )
-    if response.status_code != 200:
-        error = "Request to slack returned an error {}, the response is:\n{}".format(response.status_code, response.text)
-        errorlog(error, enable_logging)
-    if slack_sleep_enabled:
-        time.sleep(1)
+def slack(data): #queues a message for Slack, it is delivered in the background by the notifier
+    notifier.post(data)
+
+def slack_findings(domain, subdomains, dns_result = None, change = "new"): #one message per slack_batch_size new or removed subdomains of a monitored domain
+    batches = [subdomains[i:i + slack_batch_size] for i in range(0, len(subdomains), slack_batch_size)]
+    for number, batch in enumerate(batches):
+        lines = []
+        for subdomain in batch:
+            lines.append(subdomain)
+            for qtype in ['A', 'CNAME']:
+                for record in (dns_result or {}).get(subdomain, {}).get(qtype, []):
+                    lines.append("    {} : {}".format(qtype, record))
+        part = " ({}/{})".format(number + 1, len(batches)) if len(batches) > 1 else ""
+        icon = ":new:" if change == "new" else ":x:"
+        slack("{}{} {} {} subdomains of {}{}\n```{}```".format(at_channel(), icon, len(subdomains), change, domain, part, "\n".join(lines)))
+
+def emitting(change, domain, subdomains, dns_result = None): #hands the findings of a monitored domain to every output sink
+    if sinks:
+        lines = encode_events(change, domain, subdomains, dns_result)
+        for sink in sinks:
+            sink.emit(lines)
+        run_metrics.inc("sublert_sink_events_total", len(lines))
 
-def reset(do_reset): #clear the monitored list of domains and remove all locally stored files
+def opening_sinks(specs): #sublert's own messages move to stderr when the findings are streamed to stdout
+    opened = [opening_sink(spec, batch_size = sink_batch_size, flush_interval = sink_flush_interval, retries = sink_retries,
+                           on_error = lambda error: errorlog(error, enable_logging), metrics = run_metrics) for spec in specs]
+    if any(getattr(sink, "stdout", False) for sink in opened):
+        sys.stdout = sys.stderr
+    return opened
+
+def reset(do_reset): #clear the monitored list of domains and all stored subdomains
     if do_reset:
-        os.system("cd ./output/ && rm -f *.txt && cd .. && rm -f domains.txt && touch domains.txt")
+        store.reset()
+        crtsh_cache.clear()
         print(colored("\n[!] Sublert was reset successfully. Please add new domains to monitor!", "red"))
         sys.exit(1)
     else: pass
 
 def remove_domain(domain_to_delete): #remove a domain from the monitored list
-    new_list = []
     if domain_to_delete:
-        with open("domains.txt", "r") as domains:
-            for line in domains:
-                line = line.replace("\n", "")
-                if line in domain_to_delete:
-                    os.system("rm -f ./output/{}.txt".format(line))
-                    print(colored("\n[-] {} was successfully removed from the monitored list.".format(line), "green"))
-                else:
-                    new_list.append(line)
-        os.system("rm -f domains.txt")
-        with open("domains.txt", "w") as new_file:
-            for i in new_list:
-                new_file.write(i + "\n")
+        if store.remove_domain(domain_to_delete.lower()):
+            print(colored("\n[-] {} was successfully removed from the monitored list.".format(domain_to_delete), "green"))
+        else:
+            print(colored("\n[!] {} is not in the monitored list.".format(domain_to_delete), "red"))
         sys.exit(1)
 
 def domains_listing(): #list all the monitored domains
     global list_domains
     if list_domains:
         print(colored("\n[*] Below is the list of monitored domain names:\n", "green"))
-        with open("domains.txt", "r") as monitored_list:
-            for domain in monitored_list:
-                print(colored("{}".format(domain.replace("\n", "")), "yellow"))
+        for domain in store.domains():
+            print(colored(domain, "yellow"))
         sys.exit(1)
 
 def errorlog(error, enable_logging): #log errors and post them to slack channel
@@ -155,268 +232,719 @@ def errorlog(error, enable_logging): #log errors and post them to slack channel
             errorlog(error, enable_logging)
     else: pass
 
+class connection_pool(object): #thread-safe pool of crt.sh postgres connections shared by every lookup
+    def __init__(self, size):
+        self.size = size
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size) #blocks callers instead of raising PoolError when all connections are busy
+
+    def getconn(self):
+        self.slots.acquire()
+        try:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(0, self.size, dbname = DB_NAME, user = DB_USER, host = DB_HOST, port = DB_PORT)
+            return self.pool.getconn()
+        except:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, close = False):
+        try:
+            self.pool.putconn(conn, close = close or bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    def closeall(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+
+db_pool = connection_pool(DB_POOL_SIZE)
+public_suffixes = None #compiled from the tld data by the first wildcard check
+suffixes_lock = threading.Lock()
+crtsh_session = requests.Session() #keep-alive connections to the crt.sh JSON API
+crtsh_cache = response_cache(http_cache_dir, http_cache_ttl, http_cache_size)
+run_metrics = metrics_registry()
+profiler = None #set by --profile
+sinks = [] #output sinks opened from output_sinks and --sink
+notifier = slack_notifier(posting_webhook, slack_retries, 1 if slack_sleep_enabled else 0, on_error = lambda error: errorlog(error, enable_logging), metrics = run_metrics)
+
 class cert_database(object): #Connecting to crt.sh public API to retrieve subdomains
     global enable_logging
-    def lookup(self, domain, wildcard = True):
+    def lookup(self, domain, wildcard = True, since = None, known = None): #since: only return names from certificates with a greater ID, known: names crt.sh may leave out
+        self.watermark = since #highest certificate ID seen, used as the starting point of the next incremental lookup
         try:
             #connecting to crt.sh postgres database to retrieve subdomains.
-            unique_domains = set()
+            unique_domains = index_builder() #compact, names from millions of certificates don't each become a str kept in a set
             domain = domain.replace('%25.', '')
-            conn = psycopg2.connect("dbname={0} user={1} host={2}".format(DB_NAME, DB_USER, DB_HOST))
-            conn.autocommit = True
-            cursor = conn.cursor()
-            cursor.execute("SELECT ci.NAME_VALUE NAME_VALUE FROM certificate_identity ci WHERE ci.NAME_TYPE = 'dNSName' AND reverse(lower(ci.NAME_VALUE)) LIKE reverse(lower('%{}'));".format(domain))
-            for result in cursor.fetchall():
-                matches = re.findall(r"\'(.+?)\'", str(result))
-                for subdomain in matches:
-                    try:
-                        if get_fld("https://" + subdomain) == domain:
-                            unique_domains.add(subdomain.lower())
-                    except: pass
-            return sorted(unique_domains)
+            conn = db_pool.getconn()
+            try:
+                cursor = conn.cursor(name = "sublert_lookup") #server-side cursor, rows are streamed in batches of DB_FETCH_SIZE
+                query, parameters = identities_query(domain.lower(), since, known)
+                cursor.execute(query, parameters)
+                rows = query_time = parse_time = 0
+                while True:
+                    start = time.time()
+                    batch = cursor.fetchmany(DB_FETCH_SIZE)
+                    query_time += time.time() - start
+                    if not batch:
+                        break
+                    start = time.time()
+                    for name_value, certificate_id in batch: #distinct lower-cased names, plus one row holding the highest certificate ID
+                        if name_value is None:
+                            self.watermark = certificate_id or self.watermark
+                        else:
+                            unique_domains.add(name_value)
+                    rows += len(batch)
+                    parse_time += time.time() - start
+                cursor.close()
+                conn.rollback() #read-only transaction, ends it so the connection can be reused
+            except:
+                db_pool.putconn(conn, close = True)
+                raise
+            db_pool.putconn(conn)
+            unique_domains = unique_domains.finish()
+            counting_lookup(rows - 1, len(unique_domains), query_time, parse_time) #minus the watermark row
+            return unique_domains
         except:
-            base_url = "https://crt.sh/?q={}&output=json"
+            self.watermark = since
+            base_url = crtsh_url + "?q={}&output=json"
             if wildcard:
                 domain = "%25.{}".format(domain)
                 url = base_url.format(domain)
-            subdomains = set()
+            subdomains = index_builder()
             user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:64.0) Gecko/20100101 Firefox/64.0'
-            req = requests.get(url, headers={'User-Agent': user_agent}, timeout=30, verify=False) #times out after 30 seconds waiting (Mainly for large datasets)
-            if req.status_code == 200:
-                content = req.content.decode('utf-8')
-                data = json.loads(content)
-                for subdomain in data:
-                    subdomains.add(subdomain["name_value"].lower())
-                return sorted(subdomains)
+            start = time.time()
+            body = crtsh_cache.fetch(crtsh_session, url, {'User-Agent': user_agent}, timeout=30) #times out after 30 seconds without receiving data
+            query_time = time.time() - start
+            if body is not None:
+                rows = 0
+                start = time.time()
+                with body:
+                    for subdomain in iter_json_array(body): #the JSON API can't filter on certificate ID, older entries are skipped here instead
+                        certificate_id = subdomain.get("id")
+                        if since and certificate_id and certificate_id <= since:
+                            continue
+                        rows += 1
+                        if certificate_id:
+                            self.watermark = max(self.watermark or 0, certificate_id)
+                        subdomains.add(subdomain["name_value"].lower())
+                subdomains = subdomains.finish()
+                counting_lookup(rows, len(subdomains), query_time, time.time() - start)
+                return subdomains
+
+def identities_query(domain, since = None, known = None): #names are deduplicated and lower-cased by crt.sh, only the names crt.sh holds under the domain are matched
+    pattern = domain[::-1].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") #anchored prefix of the reverse(lower(NAME_VALUE)) index
+    parameters = {"pattern": pattern + ".%", "apex": domain[::-1]}
+    query = ("WITH identities AS (SELECT lower(ci.NAME_VALUE) NAME_VALUE, ci.CERTIFICATE_ID CERTIFICATE_ID FROM certificate_identity ci "
+             "WHERE ci.NAME_TYPE = 'dNSName' AND (reverse(lower(ci.NAME_VALUE)) LIKE %(pattern)s OR reverse(lower(ci.NAME_VALUE)) = %(apex)s)")
+    if since:
+        query += " AND ci.CERTIFICATE_ID > %(since)s"
+        parameters["since"] = int(since)
+    query += ") SELECT NULL::text, max(CERTIFICATE_ID) FROM identities UNION ALL SELECT DISTINCT NAME_VALUE, NULL::bigint FROM identities"
+    if known:
+        query += " WHERE NAME_VALUE NOT IN (SELECT unnest(%(known)s::text[]))"
+        parameters["known"] = list(known)
+    return query, parameters
+
+def counting_lookup(rows, names, query_time, parse_time):
+    run_metrics.observe("crtsh_query", query_time)
+    run_metrics.observe("crtsh_parse", parse_time)
+    run_metrics.inc("sublert_crtsh_lookups_total")
+    run_metrics.inc("sublert_crtsh_rows_total", rows)
+    run_metrics.inc("sublert_crtsh_names_total", names)
+    run_metrics.inc("sublert_crtsh_duplicates_total", rows - names)
 
 def queuing(): #using the queue for multithreading purposes
     global domain_to_monitor
-    global q1
-    global q2
-    q1 = queue.Queue(maxsize=0)
-    q2 = queue.Queue(maxsize=0)
+    global q
+    q = queue.Queue(maxsize=0)
     if domain_to_monitor:
         pass
-    elif os.path.getsize("domains.txt") == 0:
-        print(colored("[!] Please consider adding a list of domains to monitor first.", "red"))
-        sys.exit(1)
     else:
-        with open("domains.txt", "r") as targets:
-            for line in targets:
-                if line != "":
-                    q1.put(line.replace('\n', ''))
-                    q2.put(line.replace('\n', ''))
-                else: pass
-
-def adding_new_domain(q1): #adds a new domain to the monitoring list
+        domains = store.domains()
+        if not domains:
+            print(colored("[!] Please consider adding a list of domains to monitor first.", "red"))
+            sys.exit(1)
+        store.discard() #leftovers of an interrupted run
+        for domain in domains:
+            q.put(domain)
+
+def lookup_with_retry(domain, since = None, known = None): #queries crt.sh and retries failed lookups with an exponential backoff, returns the subdomains and the new watermark
+    error = None
+    for attempt in range(lookup_retries + 1):
+        try:
+            database = cert_database()
+            response = database.lookup(domain, since = since, known = known)
+            if response is not None:
+                return response, database.watermark
+            error = "crt.sh returned an invalid response for {}".format(domain)
+        except Exception as e:
+            error = "Looking up {} failed: {}".format(domain, e)
+        if attempt < lookup_retries:
+            run_metrics.inc("sublert_crtsh_retries_total")
+            delay = lookup_backoff * (2 ** attempt)
+            print(colored("[!] {}. Retrying in {} seconds.".format(error, delay), "red"))
+            time.sleep(delay)
+    run_metrics.inc("sublert_crtsh_failures_total")
+    errorlog(error, enable_logging)
+    return None, since
+
+def adding_new_domain(): #adds a new domain to the monitoring list
     unique_list = []
     global domain_to_monitor
     global input
-    if domain_to_monitor:
-        if not os.path.isfile('./domains.txt'): #check if domains.txt exist, if not create a new one
-            os.system("touch domains.txt")
-        else: pass
-        with open("domains.txt", "r+") as domains: #checking domain name isn't already monitored
-            for line in domains:
-                if domain_to_monitor == line.replace('\n', ''):
-                    print(colored("[!] The domain name {} is already being monitored.".format(domain_to_monitor), "red"))
-                    sys.exit(1)
-            response = cert_database().lookup(domain_to_monitor)
-            if response:
-                with open("./output/" + domain_to_monitor.lower() + ".txt", "a") as subdomains: #saving a copy of current subdomains
-                    for subdomain in response:
-                        subdomains.write(subdomain + "\n")
-                with open("domains.txt", "a") as domains: #fetching subdomains if not monitored
-                    domains.write(domain_to_monitor.lower() + '\n')
-                    print(colored("\n[+] Adding {} to the monitored list of domains.\n".format(domain_to_monitor), "yellow"))
-                try: input = raw_input #fixes python 2.x and 3.x input keyword
-                except NameError: pass
-                if not question: sys.exit(1)
-                choice = input(colored("[?] Do you wish to list subdomains found for {}? [Y]es [N]o (default: [N]) ".format(domain_to_monitor), "yellow")) #listing subdomains upon request
-                if choice.upper() == "Y":
-                        for subdomain in response:
-                            unique_list.append(subdomain)
-                        unique_list = list(set(unique_list))
-                        for subdomain in unique_list:
-                            print(colored(subdomain, "yellow"))
+    if store.is_monitored(domain_to_monitor.lower()): #checking domain name isn't already monitored
+        if interval is not None or priority is not None: #only the daemon schedule of the domain is updated
+            store.set_schedule(domain_to_monitor.lower(), interval, priority)
+            print(colored("[*] Updated the schedule of {}.".format(domain_to_monitor), "green"))
+            sys.exit(0)
+        print(colored("[!] The domain name {} is already being monitored.".format(domain_to_monitor), "red"))
+        sys.exit(1)
+    response, watermark = lookup_with_retry(domain_to_monitor)
+    if response:
+        store.add_domain(domain_to_monitor.lower(), response, watermark) #saving a copy of current subdomains
+        store.set_schedule(domain_to_monitor.lower(), interval, priority)
+        print(colored("\n[+] Adding {} to the monitored list of domains.\n".format(domain_to_monitor), "yellow"))
+        try: input = raw_input #fixes python 2.x and 3.x input keyword
+        except NameError: pass
+        if not question: sys.exit(1)
+        choice = input(colored("[?] Do you wish to list subdomains found for {}? [Y]es [N]o (default: [N]) ".format(domain_to_monitor), "yellow")) #listing subdomains upon request
+        if choice.upper() == "Y":
+                for subdomain in response:
+                    unique_list.append(subdomain)
+                unique_list = list(set(unique_list))
+                for subdomain in unique_list:
+                    print(colored(subdomain, "yellow"))
+    else:
+        print(colored("\n[!] Unfortunately, we couldn't find any subdomain for {}".format(domain_to_monitor), "red"))
+        sys.exit(1)
+
+def reading_domains(path): #normalized and deduplicated domains of an import list, plus the number of invalid lines
+    domains, invalid = set(), 0
+    source = sys.stdin if path == "-" else open(path, "r")
+    try:
+        for line in source:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            try:
+                domains.add(get_fld(line.lower(), fix_protocol = True))
+            except Exception:
+                invalid += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return domains, invalid
+
+def baselining(q, results): #fetches baselines from the queue until it receives the shutdown sentinel
+    while True:
+        domain = q.get()
+        if domain is None:
+            break
+        try:
+            response, watermark = lookup_with_retry(domain)
+        except Exception as e:
+            errorlog("Unexpected error while fetching the baseline of {}: {}".format(domain, e), enable_logging)
+            response, watermark = None, None
+        results.put((domain, response, watermark))
+
+def importing(path, threads): #bulk import, every domain is saved right away so an interrupted import resumes with the baselines still missing
+    domains, invalid = reading_domains(path)
+    added = store.add_domains(sorted(domains), interval, priority)
+    missing = store.without_baseline()
+    print(colored("[*] {} domains read, {} new, {} already monitored, {} invalid lines skipped, {} baselines to fetch.".format(
+        len(domains), added, len(domains) - added, invalid, len(missing)), "green"))
+    if not missing:
+        return
+    work, results = queue.Queue(), queue.Queue()
+    for domain in missing:
+        work.put(domain)
+    for i in range(max(1, min(threads, len(missing)))):
+        starting_thread(baselining, work, results)
+        work.put(None)
+    batch, done, failed = [], 0, 0
+    start = flushed = time.time()
+    try:
+        while done < len(missing):
+            domain, response, watermark = results.get()
+            done += 1
+            if response is None:
+                failed += 1
             else:
-                print(colored("\n[!] Unfortunately, we couldn't find any subdomain for {}".format(domain_to_monitor), "red"))
-                sys.exit(1)
-    else: #checks if a domain is monitored but has no text file saved in ./output
-                try:
-                    line = q1.get(timeout=10)
-                    if not os.path.isfile("./output/" + line.lower() + ".txt"):
-                        response = cert_database().lookup(line)
-                        if response:
-                            with open("./output/" + line.lower() + ".txt", "a") as subdomains:
-                                for subdomain in response:
-                                    subdomains.write(subdomain + "\n")
-                        else: pass
-                    else: pass
-                except queue.Empty:
-                    pass
-
-def check_new_subdomains(q2): #retrieves new list of subdomains and stores a temporary text file for comparaison purposes
-    global domain_to_monitor
-    global domain_to_delete
-    if domain_to_monitor is None:
-        if domain_to_delete is None:
+                batch.append((domain, response, watermark))
+            if len(batch) >= import_batch_size or time.time() - flushed > 5 or done == len(missing):
+                store.add_baselines(batch)
+                batch, flushed = [], time.time()
+            reporting_progress(done, len(missing), failed, time.time() - start)
+    except KeyboardInterrupt:
+        store.add_baselines(batch)
+        print(colored("\n[!] Import interrupted, run the same command again to fetch the {} remaining baselines.".format(len(missing) - done + failed), "red"))
+        sys.exit(1)
+    print(colored("\n[*] Imported {} baselines in {:.2f}s, {} lookups failed and are retried by the next run.".format(
+        done - failed, time.time() - start, failed), "green"))
+
+def reporting_progress(done, total, failed, elapsed):
+    rate = done / elapsed if elapsed else 0
+    eta = int((total - done) / rate) if rate else 0
+    sys.stdout.write("\r[*] {}/{} baselines, {} failed, {:.1f} domains/s, ETA {}:{:02d}:{:02d} ".format(
+        done, total, failed, rate, eta // 3600, eta // 60 % 60, eta % 60))
+    sys.stdout.flush()
+
+def fetching_baseline(domain): #saves the current subdomains of a monitored domain that has no baseline yet
+    response, watermark = lookup_with_retry(domain)
+    if response:
+        store.add_domain(domain, response, watermark)
+    return response is not None
+
+def check_new_subdomains(domain, full = False): #retrieves new list of subdomains and stages it for comparaison purposes
+    since = None if full else store.watermark(domain)
+    known = store.subdomains(domain, DB_EXCLUDE_KNOWN) if since and DB_EXCLUDE_KNOWN else None #a complete lookup must list every name to tell which ones were removed
+    response, watermark = lookup_with_retry(domain, since, known)
+    if response is not None: #nothing is staged when the lookup failed, the domain never reaches the diff stage
+        store.stage(domain, response, watermark, complete = since is None) #an incremental lookup only holds names from newer certificates
+    return response is not None
+
+def checking_domain(domain, full = False): #returns False when crt.sh couldn't be queried
+    with run_metrics.timer("check"):
+        if not store.has_baseline(domain):
+            return fetching_baseline(domain)
+        return check_new_subdomains(domain, full)
+
+def worker(q, timings, checked): #processes domains from the queue until it receives the shutdown sentinel, and hands them to the diff stage
+    while True:
+        domain = q.get()
+        if domain is None:
+            q.task_done()
+            break
+        start = time.time()
+        ok = False
+        try:
+            ok = checking_domain(domain, full_resync)
+        except Exception as e:
+            errorlog("Unexpected error while checking {}: {}".format(domain, e), enable_logging)
+        finally:
+            timings[domain] = time.time() - start
+            print("[*] Checked {} in {:.2f}s".format(domain, timings[domain]))
+            q.task_done()
+        if ok:
+            checked.put(domain) #waits while the diff stage is pipeline_queue_size domains behind
+
+def diffing_domain(domain): #new and removed subdomains of the staged lookup of a single domain
+    try:
+        with run_metrics.timer("diff"):
+            added, removed = store.changes(domain)
+            if removed: #reported right away, even when the staged lookup is discarded afterwards, E.g: none of the new subdomains resolve
+                store.prune(domain)
+            if not added: #nothing to notify, the state can move forward right away
+                store.rotate([domain])
+        run_metrics.inc("sublert_new_subdomains_total", len(added))
+        run_metrics.inc("sublert_removed_subdomains_total", len(removed))
+        return set(subdomain.replace('*.', '') for subdomain in added), set(subdomain.replace('*.', '') for subdomain in removed)
+    except sqlite3.Error as e:
+        error = "There was an error comparing the subdomains of {}: {}".format(domain, e)
+        errorlog(error, enable_logging)
+        store.discard(domain)
+        return set(), set()
+
+def reporting_removed(domain, removed_subdomains): #subdomains of a monitored domain that are no longer returned by crt.sh
+    if removed_subdomains:
+        print(colored("\n[-] {} subdomains of {} are no longer listed on crt.sh:".format(len(removed_subdomains), domain), "yellow"))
+        for subdomain in removed_subdomains:
+            print(colored(subdomain, "yellow"))
+        emitting("removed", domain, removed_subdomains)
+        if removed_notification_enabled:
+            slack_findings(domain, removed_subdomains, change = "removed")
+
+def parse_resolvers(value): #accepts a comma-separated list or a file with one resolver per line. E.g: 1.1.1.1,8.8.8.8:53
+    nameservers = []
+    if not value:
+        return nameservers
+    if os.path.isfile(value):
+        with open(value, "r") as resolvers_file:
+            entries = resolvers_file.read().splitlines()
+    else:
+        entries = value.split(",")
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        if entry.startswith("["): #bracketed IPv6 with an optional port, E.g: [2606:4700:4700::1111]:53
+            host, _, port = entry[1:].partition("]")
+            port = port.lstrip(":")
+        elif entry.count(":") == 1:
+            host, port = entry.split(":")
+        else:
+            host, port = entry, ""
+        try:
+            nameservers.append((host, int(port or 53)))
+        except ValueError:
+            print(colored("[!] Ignoring invalid resolver: {}".format(entry), "red"))
+    return nameservers
+
+def dns_records(answers): #turns A/CNAME answers (or the exception raised while querying) into the dns_results format
+    records = {}
+    errors = [answer for answer in answers.values() if isinstance(answer, Exception)]
+    if any(isinstance(e, dns.resolver.NXDOMAIN) for e in errors):
+        return records
+    elif any(isinstance(e, dns.resolver.Timeout) for e in errors):
+        records["A"] = ["Timed out while resolving."]
+        records["CNAME"] = ["Timed out error while resolving."]
+        return records
+    elif errors:
+        records["A"] = ["There was an error while resolving."]
+        records["CNAME"] = ["There was an error while resolving."]
+        return records
+    for qtype, dns_output in answers.items():
+        if dns_output.rrset is not None:
+            records[qtype] = [str(i) for i in dns_output.rrset]
+    return records
+
+def resolve_sequentially(subdomains, nameservers, timeout): #blocking fallback used when the asyncio resolver is not available
+    answers = {}
+    resolvers = []
+    for host, port in nameservers or []:
+        resolver = dns.resolver.Resolver(configure = False)
+        resolver.nameservers = [host]
+        resolver.port = port
+        resolvers.append(resolver)
+    if not resolvers:
+        resolvers.append(dns.resolver.Resolver())
+    for resolver in resolvers:
+        resolver.timeout = timeout
+        resolver.lifetime = timeout
+    for index, domain in enumerate(subdomains):
+        resolver = resolvers[index % len(resolvers)]
+        resolve = getattr(resolver, "resolve", None) or resolver.query #dnspython 1.x only provides query()
+        answers[domain] = {}
+        for qtype in ['A', 'CNAME']:
             try:
-                line = q2.get(timeout=10)
-                print("[*] Checking {}".format(line))
-                with open("./output/" + line.lower() + "_tmp.txt", "a") as subs:
-                    response = cert_database().lookup(line)
-                    if response:
-                        for subdomain in response:
-                            subs.write(subdomain + "\n")
-            except queue.Empty:
-                pass
-    else: pass
+                answers[domain][qtype] = resolve(domain, qtype, raise_on_no_answer = False)
+            except dns.exception.DNSException as e:
+                answers[domain][qtype] = e
+                break
+    return answers
 
-def compare_files_diff(domain_to_monitor): #compares the temporary text file with previously stored copy to check if there are new subdomains
-    global enable_logging
-    if domain_to_monitor is None:
-        if domain_to_delete is None:
-            result = []
-            with open("domains.txt", "r") as targets:
-                for line in targets:
-                    domain_to_monitor = line.replace('\n', '')
-                    try:
-                        file1 = open("./output/" + domain_to_monitor.lower() + '.txt', 'r')
-                        file2 = open("./output/" + domain_to_monitor.lower() + '_tmp.txt', 'r')
-                        diff = difflib.ndiff(file1.readlines(), file2.readlines())
-                        changes = [l for l in diff if l.startswith('+ ')] #check if there are new items/subdomains
-                        newdiff = []
-                        for c in changes:
-                            c = c.replace('+ ', '')
-                            c = c.replace('*.', '')
-                            c = c.replace('\n', '')
-                            result.append(c)
-                            result = list(set(result)) #remove duplicates
-                    except:
-                        error = "There was an error opening one of the files: {} or {}".format(domain_to_monitor + '.txt', domain_to_monitor + '_tmp.txt')
-                        errorlog(error, enable_logging)
-                        os.system("rm -f ./output/{}".format(line.replace('\n','') + "_tmp.txt"))
-                return(result)
-
-def dns_resolution(new_subdomains): #Perform DNS resolution on retrieved subdomains
-    dns_results = {}
-    subdomains_to_resolve = new_subdomains
-    print(colored("\n[!] Performing DNS resolution. Please do not interrupt!", "red"))
-    for domain in subdomains_to_resolve:
+def dns_status(answers): #ok, nxdomain or failure, and for how many seconds the result may be reused
+    if any(isinstance(answer, dns.resolver.NXDOMAIN) for answer in answers.values()):
+        return "nxdomain", dns_negative_ttl
+    if any(isinstance(answer, Exception) for answer in answers.values()): #timeouts and server failures are retried sooner
+        return "failure", dns_failure_ttl
+    ttls = [answer.rrset.ttl for answer in answers.values() if answer.rrset is not None]
+    return "ok", min(ttls) if ttls else dns_negative_ttl #no records at all is cached like NXDOMAIN
+
+def registrable_domain(name): #E.g: dev.api.example.co.uk -> example.co.uk
+    global public_suffixes
+    with suffixes_lock:
+        if public_suffixes is None:
+            public_suffixes = suffix_matcher()
+    return public_suffixes.registrable_domain(name)
+
+def wildcard_zone(name): #parent zone probed for a wildcard record, None above the registrable domain
+    zone = name.partition(".")[2]
+    registrable = registrable_domain(name)
+    if registrable and (zone == registrable or zone.endswith("." + registrable)):
+        return zone
+    return None
+
+def matches_wildcard(records, wildcard): #the name only resolves because of the wildcard of its parent zone
+    return bool(records) and all(set(records.get(qtype, [])) <= set(wildcard.get(qtype, [])) for qtype in ('A', 'CNAME'))
+
+def querying(names, nameservers): #A and CNAME answers of every name, or the exception raised while querying it
+    if not names:
+        return {}
+    with run_metrics.timer("dns"):
+        if async_resolver:
+            answers = async_resolver.resolve(names, nameservers, dns_concurrency, dns_timeout)
+        else:
+            answers = resolve_sequentially(names, nameservers, dns_timeout)
+    for domain_answers in answers.values():
+        run_metrics.inc("sublert_dns_queries_total", len(domain_answers))
+        for answer in domain_answers.values():
+            if isinstance(answer, dns.resolver.NXDOMAIN):
+                run_metrics.inc("sublert_dns_nxdomain_total")
+            elif isinstance(answer, Exception):
+                run_metrics.inc("sublert_dns_failures_total")
+    return answers
+
+def resolve_subdomains(subdomains, nameservers = None): #resolves A and CNAME records of every subdomain, reusing the cached results that didn't expire, returns them and the names that only resolve through a wildcard
+    subdomains_to_resolve = []
+    for domain in subdomains:
         domain = domain.replace('+ ','')
         domain = domain.replace('*.','')
-        dns_results[domain] = {}
-        try:
-            for qtype in ['A','CNAME']:
-                dns_output = dns.resolver.query(domain,qtype, raise_on_no_answer = False)
-                if dns_output.rrset is None:
-                    pass
-                elif dns_output.rdtype == 1:
-                    a_records = [str(i) for i in dns_output.rrset]
-                    dns_results[domain]["A"] = a_records
-                elif dns_output.rdtype == 5:
-                    cname_records = [str(i) for i in dns_output.rrset]
-                    dns_results[domain]["CNAME"] = cname_records
-                else: pass
-        except dns.resolver.NXDOMAIN:
-            pass
-        except dns.resolver.Timeout:
-            dns_results[domain]["A"] = eval('["Timed out while resolving."]')
-            dns_results[domain]["CNAME"] = eval('["Timed out error while resolving."]')
-            pass
-        except dns.exception.DNSException:
-            dns_results[domain]["A"] = eval('["There was an error while resolving."]')
-            dns_results[domain]["CNAME"] = eval('["There was an error while resolving."]')
-            pass
-    if dns_results:
-        return posting_to_slack(None, True, dns_results) #Slack new subdomains with DNS ouput
-    else:
-        return posting_to_slack(None, False, None) #Nothing found notification
+        subdomains_to_resolve.append(domain)
+    names = sorted(set(subdomains_to_resolve))
+    zones = dict((name, wildcard_zone(name)) for name in names) if dns_wildcard_detection else {}
+    wildcards = sorted(set("*." + zone for zone in zones.values() if zone))
+    cached = store.cached_dns(names + wildcards)
+    run_metrics.inc("sublert_dns_cache_hits_total", len(cached))
+    probes = dict(("sublert-{:012x}.{}".format(random.getrandbits(48), wildcard[2:]), wildcard) for wildcard in wildcards if wildcard not in cached) #a random label only resolves through a wildcard
+    answers = querying([name for name in names if name not in cached] + sorted(probes), nameservers)
+    fresh = []
+    now = time.time()
+    for name, name_answers in answers.items():
+        status, ttl = dns_status(name_answers)
+        name = probes.get(name, name)
+        cached[name] = (dns_records(name_answers), status)
+        fresh.append((name, cached[name][0], status, now + ttl))
+    store.cache_dns(fresh)
+    results, suppressed = {}, set()
+    for name in subdomains_to_resolve:
+        records, status = cached[name]
+        wildcard = cached.get("*." + zones[name]) if zones.get(name) else None
+        if status == "ok" and wildcard and wildcard[1] == "ok" and matches_wildcard(records, wildcard[0]):
+            records = {} #not notified, so wildcard zones don't flood Slack
+            suppressed.add(name)
+        results[name] = records
+    if suppressed:
+        run_metrics.inc("sublert_dns_wildcard_total", len(suppressed))
+        print(colored("[*] Ignoring {} subdomains that only resolve through a wildcard record.".format(len(suppressed)), "yellow"))
+    return results, suppressed
 
 def at_channel(): #control slack @channel
     return("<!channel> " if at_channel_enabled else "")
 
-def posting_to_slack(result, dns_resolve, dns_output): #sending result to slack workplace
-    global domain_to_monitor
-    global new_subdomains
-    if dns_resolve:
-        dns_result = dns_output
-        if dns_result:
-            dns_result = {k:v for k,v in dns_result.items() if v} #filters non-resolving subdomains
-            rev_url = []
-            print(colored("\n[!] Exporting result to Slack. Please do not interrupt!", "red"))
-            for url in dns_result:
-                url = url.replace('*.', '')
-                url = url.replace('+ ', '')
-                rev_url.append(get_fld(url, fix_protocol = True))
-
-            unique_list = list(set(new_subdomains) & set(dns_result.keys())) #filters non-resolving subdomains from new_subdomains list
-
-            for subdomain in unique_list:
-                data = "{}:new: {}".format(at_channel(), subdomain)
-                slack(data)
-                try:
-                    if dns_result[subdomain]["A"]:
-                        for i in dns_result[subdomain]["A"]:
-                            data = "```A : {}```".format(i)
-                            slack(data)
-                except: pass
-                try:
-                    if dns_result[subdomain]['CNAME']:
-                        for i in dns_result[subdomain]['CNAME']:
-                            data = "```CNAME : {}```".format(i)
-                            slack(data)
-                except: pass
-            print(colored("\n[!] Done. ", "green"))
-            rev_url = list(set(rev_url))
-            for url in rev_url:
-                os.system("rm -f ./output/" + url.lower() + ".txt")
-                os.system("mv -f ./output/" + url.lower() + "_tmp.txt " + "./output/" + url.lower() + ".txt") #save the temporary one
-            os.system("rm -f ./output/*_tmp.txt") #remove the remaining tmp files
-
-    elif result:
-        rev_url = []
-        print(colored("\n[!] Exporting the result to Slack. Please don't interrupt!", "red"))
-        for url in result:
-            url = "https://" + url.replace('+ ', '')
-            rev_url.append(get_fld(url))
-            data = "{}:new: {}".format(at_channel(), url)
-            slack(data)
-        print(colored("\n[!] Done. ", "green"))
-        rev_url = list(set(rev_url))
-
-        for url in rev_url:
-            os.system("rm -f ./output/" + url.lower() + ".txt")
-            os.system("mv -f ./output/" + url.lower() + "_tmp.txt " + "./output/" + url.lower() + ".txt") #save the temporary one
-        os.system("rm -f ./output/*_tmp.txt") #remove the remaining tmp files
+def exporting(groups, dns_result = None): #notifies the new subdomains of each monitored domain and saves their staged lookups
+    for domain in sorted(groups):
+        emitting("new", domain, groups[domain], dns_result)
+        if dns_result is None:
+            slack_findings(domain, ["https://" + subdomain for subdomain in groups[domain]])
+        else:
+            slack_findings(domain, groups[domain], dns_result)
+    store.rotate(groups.keys()) #save the staged lookups, their DNS results are kept in the DNS cache
 
-    else:
-        if not domain_to_monitor:
-            data = "{}:-1: We couldn't find any new valid subdomains.".format(at_channel())
-            slack(data)
-            print(colored("\n[!] Done. ", "green"))
-            os.system("rm -f ./output/*_tmp.txt")
-        else: pass
-
-def multithreading(threads):
-    global domain_to_monitor
+def diffing_step(domain): #reports the removed subdomains of a checked domain, returns its new ones for the next steps or None
+    added, removed = diffing_domain(domain)
+    reporting_removed(domain, sorted(removed))
+    if added:
+        return domain, added, None, set()
+    store.discard(domain)
+    return None
+
+def resolving_step(domain, added, dns_result, suppressed):
+    results, suppressed = resolve_subdomains(added, resolvers)
+    dns_result = {k:v for k,v in results.items() if v} #filters non-resolving subdomains
+    return domain, added, dns_result, suppressed
+
+def notifying_step(domain, added, dns_result, suppressed): #notifies the new subdomains and saves the staged lookup of a single domain, returns the number of notified subdomains
+    notified = added if dns_result is None else added & set(dns_result.keys())
+    unresolved = set(subdomain.replace('*.','') for subdomain in added - notified)
+    if notified:
+        exporting({domain: sorted(notified)}, dns_result)
+    elif suppressed and unresolved <= suppressed: #every new name is under a wildcard record and deliberately ignored, they are accepted without being notified
+        store.rotate([domain])
+    store.discard(domain) #otherwise non-resolving subdomains are looked up again next time
+    return len(notified)
+
+def processing_domain(domain, full, dns_resolve): #daemon mode: checks a single domain and notifies its changes right away
+    if not checking_domain(domain, full):
+        return False
+    changes = diffing_step(domain)
+    if changes and dns_resolve:
+        changes = resolving_step(*changes)
+    if changes:
+        notifying_step(*changes)
+    return True
+
+def stage(source, step, target = None): #runs step on every item of source until the shutdown sentinel and passes its results on to target
+    while True:
+        item = source.get()
+        if item is None:
+            break
+        try:
+            result = step(*item) if isinstance(item, tuple) else step(item)
+        except Exception as e: #the domain is skipped, a dead stage would block the stages feeding it
+            errorlog("Unexpected error while processing {}: {}".format(item[0] if isinstance(item, tuple) else item, e), enable_logging)
+            continue
+        if target is not None and result is not None:
+            target.put(result)
+
+def daemon(threads, dns_resolve): #keeps running, connections, the tld data and the state database stay open between checks
+    stopping = threading.Event()
+    resynced = set() #-f only applies to the first check of each domain
+    planner = scheduler(threads, daemon_interval, daemon_jitter, daemon_slow_lookup, daemon_retry)
+
+    def run():
+        while True:
+            domain = planner.acquire()
+            if domain is None:
+                break
+            start = time.time()
+            ok = False
+            try:
+                ok = processing_domain(domain, full_resync and domain not in resynced, dns_resolve)
+                resynced.add(domain)
+            except Exception as e:
+                errorlog("Unexpected error while checking {}: {}".format(domain, e), enable_logging)
+            finally:
+                elapsed = time.time() - start
+                planner.release(domain, elapsed, ok)
+                print("[*] Checked {} in {:.2f}s, next checks run {} at a time".format(domain, elapsed, planner.limit))
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    store.discard() #leftovers of an interrupted run
+    planner.sync(store.schedules())
+    print(colored("\n[*] Running as a daemon with {} threads, press Ctrl+C to stop.".format(threads), "green"))
     threads_list = []
-    if not domain_to_monitor:
-        num = sum(1 for line in open("domains.txt")) #minimum threads executed equals the number of monitored domains
-        for i in range(max(threads, num)):
-            if not (q1.empty() and q2.empty()):
-                t1 = threading.Thread(target = adding_new_domain, args = (q1, ))
-                t2 = threading.Thread(target = check_new_subdomains, args = (q2, ))
-                t1.start()
-                t2.start()
-                threads_list.append(t1)
-                threads_list.append(t2)
-    else:
-        adding_new_domain(domain_to_monitor)
+    for i in range(max(1, threads)):
+        threads_list.append(starting_thread(run))
+    try:
+        while not stopping.wait(daemon_reload):
+            planner.sync(store.schedules()) #picks up domains added, removed or rescheduled by other invocations
+            writing_metrics()
+    except KeyboardInterrupt:
+        pass
+    print(colored("\n[!] Stopping, waiting for the running checks to finish.", "red"))
+    planner.stop()
+    for t in threads_list:
+        t.join()
+
+def starting_thread(target, *args): #daemon thread, profiled as well when running with --profile
+    t = threading.Thread(target = profiler.wrap(target) if profiler else target, args = args)
+    t.daemon = True
+    t.start()
+    return t
+
+def worker_name(): #identifies this process in the shared work queue and lease table
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+def claiming(owner, stopping, idle = None): #checks domains claimed from the shared work queue until stopping is set, or until idle() says the queue is done
+    while not stopping.is_set():
+        claim = store.claim(owner, shard_lease, shard_max_attempts)
+        if claim is None:
+            if idle and idle():
+                break
+            stopping.wait(shard_poll)
+            continue
+        domain, complete = claim
+        start = time.time()
+        heartbeat = threading.Event()
+        starting_thread(renewing, domain, owner, heartbeat)
+        try:
+            checking_domain(domain, bool(complete))
+        except Exception as e:
+            errorlog("Unexpected error while checking {}: {}".format(domain, e), enable_logging)
+        finally:
+            heartbeat.set()
+            store.finish(domain, owner) #a failed lookup is finished too, nothing was staged for it
+            print("[*] Checked {} in {:.2f}s".format(domain, time.time() - start))
+
+def renewing(domain, owner, heartbeat): #keeps the lease of a domain alive while it is being checked, a crashed process stops renewing and the lease expires
+    while not heartbeat.wait(shard_lease / 3.0):
+        if not store.renew(domain, owner, shard_lease):
+            break
+
+def working(threads): #--worker: checks domains handed out by --distributed runs until stopped
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    print(colored("\n[*] Worker {} is waiting for domains from the shared work queue, press Ctrl+C to stop.".format(worker_name()), "green"))
+    threads_list = []
+    for i in range(max(1, threads)):
+        threads_list.append(starting_thread(claiming, worker_name(), stopping))
+    try:
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        stopping.set()
+    print(colored("\n[!] Stopping, waiting for the running checks to finish.", "red"))
+    for t in threads_list:
+        t.join()
 
+def holding_lease(name, owner, released): #renews a lease held by this process until released is set
+    while not released.wait(shard_lease / 3.0):
+        store.acquire_lease(name, owner, shard_lease)
+
+def distributing(threads, dns_resolve): #--distributed: this process and any --worker processes check the domains, the diff and notifications stay here so each change is reported once
+    owner = worker_name()
+    if not store.acquire_lease("coordinator", owner, shard_lease):
+        print(colored("[!] Another distributed run is in progress.", "red"))
+        sys.exit(1)
+    released = threading.Event()
+    starting_thread(holding_lease, "coordinator", owner, released) #until the last notification, so another run can't discard the staged lookups
+    try:
+        coordinating(threads, dns_resolve, owner)
+    finally:
+        released.set()
+        store.release_lease("coordinator", owner)
+
+def coordinating(threads, dns_resolve, owner):
+    domains = store.domains()
+    if not domains:
+        print(colored("[!] Please consider adding a list of domains to monitor first.", "red"))
+        sys.exit(1)
+    store.discard() #leftovers of an interrupted run
+    store.enqueue(domains, full_resync)
+    start = time.time()
+    stopping = threading.Event()
+    threads_list = []
+    for i in range(max(1, min(threads, len(domains)))):
+        threads_list.append(starting_thread(claiming, owner, stopping, lambda: not store.work_left(shard_max_attempts)))
+    while store.work_left(shard_max_attempts): #domains leased by crashed workers come back once their lease expires
+        time.sleep(shard_poll)
+    stopping.set()
     for t in threads_list:
         t.join()
+    print(colored("\n[*] Checked {} domains in {:.2f}s.".format(len(domains), time.time() - start), "green"))
+    for name, count in sorted(store.work_summary().items()):
+        print(colored("    {:<40} {} domains".format(name + (" (this process)" if name == owner else ""), count), "yellow"))
+    pipelining(threads, dns_resolve, store.staged_domains())
+
+def pipelining(threads, dns_resolve, staged = None): #fetch -> diff -> resolve -> notify, each domain moves to the next stage as soon as it is done with the previous one
+    checked, changed, resolved = [queue.Queue(maxsize = pipeline_queue_size) for i in range(3)] #bounded, a slow stage holds back the ones feeding it
+    timings = {}
+    notified = []
+    start = time.time()
+    fetchers = []
+    if staged is None: #staged: domains already checked by --distributed, they are only diffed and notified here
+        fetchers = [starting_thread(worker, q, timings, checked) for i in range(max(1, min(threads, q.qsize())))]
+    differ = starting_thread(stage, checked, diffing_step, changed if dns_resolve else resolved)
+    resolvers_list = [starting_thread(stage, changed, resolving_step, resolved) for i in range(pipeline_dns_threads)] if dns_resolve else []
+    notifier_thread = starting_thread(stage, resolved, lambda *changes: notified.append(notifying_step(*changes)))
+    for domain in staged or []:
+        checked.put(domain)
+    for t in fetchers: #one sentinel per worker, queued after every domain so the queue is drained first
+        q.put(None)
+    for t in fetchers:
+        t.join()
+    checked.put(None)
+    differ.join()
+    for t in resolvers_list:
+        changed.put(None)
+    for t in resolvers_list:
+        t.join()
+    resolved.put(None)
+    notifier_thread.join()
+    if fetchers:
+        report_timings(timings, time.time() - start, len(fetchers))
+    if not any(notified):
+        slack("{}:-1: We couldn't find any new valid subdomains.".format(at_channel()))
+    store.discard() #drop the remaining staged lookups, E.g: of domains whose diff failed
+
+def report_timings(timings, wall_time, workers): #summary of the time spent checking each domain
+    print(colored("\n[*] Checked {} domains in {:.2f}s using {} threads.".format(len(timings), wall_time, workers), "green"))
+    slowest = sorted(timings.items(), key = lambda item: item[1], reverse = True)[:5]
+    for domain, elapsed in slowest:
+        print(colored("    {:<40} {:.2f}s".format(domain, elapsed), "yellow"))
+
+def writing_metrics(): #Prometheus text and JSON exports of the metrics collected since the start of the process
+    run_metrics.set("sublert_slack_messages_total", notifier.delivered)
+    run_metrics.set("sublert_slack_retries_total", notifier.retried)
+    run_metrics.set("sublert_slack_failures_total", notifier.failed)
+    run_metrics.set("sublert_sink_failures_total", sum(sink.failed for sink in sinks))
+    for name in ("hits", "revalidated", "misses", "evicted"):
+        run_metrics.set("sublert_crtsh_cache_{}_total".format(name), getattr(crtsh_cache, name))
+    try:
+        run_metrics.write(metrics_prometheus, metrics_json)
+    except (IOError, OSError) as e:
+        errorlog("Writing the metrics failed: {}".format(e), enable_logging)
+
+def report_cache(): #crt.sh JSON API cache statistics, the cache is only used when the Postgres database can't be reached
+    if crtsh_cache.hits or crtsh_cache.revalidated or crtsh_cache.misses:
+        print(colored("\n[*] crt.sh cache: {} hits, {} revalidated, {} misses, {} evicted.".format(
+            crtsh_cache.hits, crtsh_cache.revalidated, crtsh_cache.misses, crtsh_cache.evicted), "green"))
 
 def string_to_bool(v):
     if isinstance(v, bool):
@@ -431,27 +959,53 @@ def string_to_bool(v):
 if __name__ == '__main__':
 
 #parse arguments
-    dns_resolve = parse_args().resolve
-    enable_logging = parse_args().logging
-    list_domains = parse_args().listing
-    domain_to_monitor = domain_sanity_check(parse_args().target)
-    question = parse_args().question
-    domain_to_delete = domain_sanity_check(parse_args().remove_domain)
-    do_reset = parse_args().reset
+    args = parse_args()
+    dns_resolve = args.resolve
+    enable_logging = args.logging
+    list_domains = args.listing
+    domain_to_monitor = domain_sanity_check(args.target)
+    question = args.question
+    domain_to_delete = domain_sanity_check(args.remove_domain)
+    do_reset = args.reset
+    full_resync = args.full_resync
+    interval = args.interval
+    priority = args.priority
+    resolvers = parse_resolvers(args.resolvers)
+    if not args.worker: #workers don't notify, the findings are reported by the --distributed run
+        sinks = opening_sinks(output_sinks + (args.sinks or []))
+    if args.profile:
+        profiler = run_profiler()
+        profiler.start()
+    store = state_store(state_database)
+    migrated = store.migrate("domains.txt", "./output/")
+    if migrated:
+        print(colored("[*] Imported {} monitored domains from domains.txt into {}.".format(migrated, state_database), "green"))
 
 #execute the various functions
     banner()
     reset(do_reset)
     remove_domain(domain_to_delete)
     domains_listing()
-    queuing()
-    multithreading(parse_args().threads)
-    new_subdomains = compare_files_diff(domain_to_monitor)
-
-# Check if DNS resolution is checked
-    if not domain_to_monitor:
-        if (dns_resolve and new_subdomains):
-            dns_resolution(new_subdomains)
-        else:
-            posting_to_slack(new_subdomains, False, None)
-    else: pass
+    if args.import_file:
+        importing(args.import_file, args.threads)
+    elif args.worker:
+        working(args.threads)
+    elif args.daemon and not domain_to_monitor:
+        daemon(args.threads, dns_resolve)
+    elif domain_to_monitor:
+        adding_new_domain()
+    elif args.distributed:
+        distributing(args.threads, dns_resolve)
+    else:
+        queuing()
+        pipelining(args.threads, dns_resolve)
+    report_cache()
+    db_pool.closeall()
+    notifier.close() #waits for the queued Slack messages
+    for sink in sinks: #and for the queued findings
+        sink.close()
+    if not args.worker: #workers would overwrite the exports of the run they are helping
+        writing_metrics()
+    store.close()
+    if profiler:
+        profiler.stop(args.profile)
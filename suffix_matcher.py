@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Registrable domain lookups against the public suffix list shipped with the tld package, without the URL
+# parsing that tld.get_fld() does for every call.
+
+from tld import get_fld
+from tld.utils import get_tld_names
+try:
+    from functools import lru_cache
+except ImportError: #python 2.x, lookups are not memoized
+    lru_cache = lambda maxsize: (lambda function: function)
+
+class suffix_matcher(object):
+    def __init__(self, trie = None, cache_size = 65536):
+        trie = trie or get_tld_names() #loaded once, tld keeps it in memory
+        self.cached = lru_cache(maxsize = cache_size)(self.match)
+        self.root = None
+        if hasattr(trie, "root"): #tld 0.9.x, later releases return a dict of tries and the memoized get_fld() is used instead
+            self.root = self.compile(trie.root)
+        else:
+            self.fallback = lru_cache(maxsize = cache_size)(lambda name: get_fld(name, fix_protocol = True, fail_silently = True))
+
+    def compile(self, node): #tld's Trie nodes become (children, exception, leaf) tuples
+        children = None
+        if node.children is not None:
+            children = dict((label, self.compile(child)) for label, child in node.children.items())
+        return (children, node.exception, node.leaf)
+
+    def match(self, name): #same walk as tld.utils.process_url(), returns the registrable domain (None when no public suffix matches) and whether every label was walked
+        parts = name.split(".")
+        node = self.root
+        length = suffix = 0
+        for part in reversed(parts):
+            children, exception, leaf = node
+            if children is None or part == exception:
+                break
+            child = children.get(part) or children.get("*")
+            if child is None:
+                break
+            length += 1
+            node = child
+            if node[2]:
+                suffix = length
+        if not suffix:
+            return None, length == len(parts)
+        return ".".join(parts[max(1, len(parts) - suffix) - 1:]), length == len(parts)
+
+    def registrable_domain(self, name): #E.g: dev.api.example.co.uk -> example.co.uk, equivalent to get_fld("https://" + name)
+        name = name.lower()
+        if self.root is None:
+            return self.fallback(name)
+        parent = name.partition(".")[2]
+        if parent: #siblings share the cached answer of their parent unless the walk went through all of the parent's labels
+            domain, complete = self.cached(parent)
+            if not complete:
+                return domain
+        return self.match(name)[0]